@@ -4,32 +4,106 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 import datetime
 
 from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 from django.utils import timezone
 
+from .utils.date_time import request_now
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
 
 def current_datetime(request):
     """
     Returns the current date, time and timezone.
+
+    The time is frozen for the request, see `utils.date_time.request_now`.
+    All values are real objects rather than lazy ones, since datetime
+    arithmetic, as in `timesince`, and tzinfo arguments are type checked,
+    and they are cheap to get anyway.
     """
+    now = request_now(request)
     return {
-        'current_datetime': timezone.now(),
-        'current_datetime_local': timezone.localtime(),
+        'current_datetime': now,
+        'current_datetime_local': timezone.localtime(now),
         'current_timezone': timezone.get_current_timezone(),
         'current_timezone_name': timezone.get_current_timezone_name(),
     }
 
 
+class SettingsMapping(Mapping):
+    """
+    A read-only mapping of the uppercase names in settings module to their
+    values.
+
+    The set of names is computed on first use, and values are looked up
+    only when they are accessed, so a template which reads none of the
+    settings costs nothing.
+
+    If `allowed` is given, only those names are exposed.
+    """
+
+    def __init__(self, allowed=None):
+        self._allowed = allowed
+        self._keys = None
+        self._values = {}
+
+    def _get_keys(self):
+        keys = self._keys
+        if keys is None:
+            names = dir(settings) if self._allowed is None else self._allowed
+            keys = self._keys = frozenset(
+                key
+                for key in names
+                if not key.startswith('__') and key.isupper() and hasattr(settings, key)
+            )
+        return keys
+
+    def __getitem__(self, key):
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+        if key not in self._get_keys():
+            raise KeyError(key)
+        value = self._values[key] = getattr(settings, key)
+        return value
+
+    def __contains__(self, key):
+        return key in self._get_keys()
+
+    def __iter__(self):
+        return iter(self._get_keys())
+
+    def __len__(self):
+        return len(self._get_keys())
+
+
+# snapshot of the settings shared by all requests in this process
+_settings_mapping = None
+
+
+@receiver(setting_changed)
+def _reset_settings_mapping(**kwargs):
+    global _settings_mapping
+    _settings_mapping = None
+
+
 def settings_module(request):
     """
     Return the whole settings module in a dictionary in template context.
 
     Caution: This should be used very carefully to not cause security
-    vulnerabilities.
+    vulnerabilities. Set `TEMPLATE_ALLOWED_SETTINGS` to a list of setting
+    names to only expose those.
     """
-    return {
-        'settings': {
-            key: getattr(settings, key)
-            for key in dir(settings)
-            if not key.startswith('__') and key.isupper()
-        }
-    }
+    global _settings_mapping
+    mapping = _settings_mapping
+    if mapping is None:
+        mapping = _settings_mapping = SettingsMapping(
+            getattr(settings, 'TEMPLATE_ALLOWED_SETTINGS', None)
+        )
+    return {'settings': mapping}
@@ -1,10 +1,49 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import copy
+
 from django.core import checks, exceptions
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
 
-__all__ = ['SerialField', 'SmallSerialField', 'BigSerialField']
+__all__ = [
+    'ChangeTrackingMixin',
+    'SerialField',
+    'SmallSerialField',
+    'BigSerialField',
+]
+
+
+def _is_tracked(field, excludes):
+    # automatically assigned primary keys are not interesting
+    return field.name not in excludes and not isinstance(field, models.AutoField)
+
+
+def _resolve_related(pending):
+    """
+    Replace primary keys of related objects in the given changes with the
+    objects, fetching the objects of each related model in one query.
+
+    `pending` is a list of `(changes, key, field, old_pk, new_pk, new_obj)`,
+    where `new_obj` is the new related object if it is already known.
+    """
+    pks = {}
+    for changes, key, field, old_pk, new_pk, new_obj in pending:
+        model_pks = pks.setdefault(field.related_model, set())
+        if old_pk is not None:
+            model_pks.add(old_pk)
+        if new_pk is not None and new_obj is None:
+            model_pks.add(new_pk)
+    objects = dict(
+        (model, model._base_manager.in_bulk(list(model_pks)))
+        for model, model_pks in pks.items()
+        if model_pks
+    )
+    for changes, key, field, old_pk, new_pk, new_obj in pending:
+        related = objects.get(field.related_model, {})
+        if new_obj is None:
+            new_obj = related.get(new_pk)
+        changes[key] = (related.get(old_pk), new_obj)
 
 
 def get_changes_between_objects(object1, object2, excludes=[]):
@@ -13,43 +52,192 @@ def get_changes_between_objects(object1, object2, excludes=[]):
     Useful when we need to compare old and new instance of an object,
     for example in a pre_save signal receiver.
 
+    Related objects are fetched in one query per related model. Models
+    using `ChangeTrackingMixin` can get the same without the old object.
+
     :param object1: The first object
     :param object2: The second object
     :param excludes: A list of field names to exclude
     """
     changes = {}
+    pending = []
 
     # For every field in the model
     for field in object1._meta.fields:
         # Don't process excluded fields or automatically updating fields
-        if not field.name in excludes and not isinstance(field, fields.AutoField):
-            # If the field isn't a related field (i.e. a foreign key)..
-            if not isinstance(field, fields.related.RelatedField):
-                old_val = field.value_from_object(object1)
-                new_val = field.value_from_object(object2)
-                # If the old value doesn't equal the new value, and they're
-                # not both equivalent to null (i.e. None and "")
-                if old_val != new_val and not (not old_val and not new_val):
-                    changes[field.verbose_name] = (old_val, new_val)
+        if not _is_tracked(field, excludes):
+            continue
+        old_val = field.value_from_object(object1)
+        new_val = field.value_from_object(object2)
+        # If the field isn't a related field (i.e. a foreign key)..
+        if not field.is_relation:
+            # If the old value doesn't equal the new value, and they're
+            # not both equivalent to null (i.e. None and "")
+            if old_val != new_val and not (not old_val and not new_val):
+                changes[field.verbose_name] = (old_val, new_val)
+
+        # If the field is a related field..
+        elif old_val != new_val:
+            pending.append(
+                (changes, field.verbose_name, field, old_val, new_val, None)
+            )
+
+    _resolve_related(pending)
+    return changes
 
-            # If the field is a related field..
-            elif isinstance(field, fields.related.RelatedField):
-                if field.value_from_object(object1) != field.value_from_object(object2):
-                    old_pk = field.value_from_object(object1)
-                    try:
-                        old_val = field.related.parent_model.objects.get(pk=old_pk)
-                    except field.related.parent_model.DoesNotExist:
-                        old_val = None
-
-                    new_pk = field.value_from_object(object2)
-                    try:
-                        new_val = field.related.parent_model.objects.get(pk=new_pk)
-                    except field.related.parent_model.DoesNotExist:
-                        new_val = None
 
+def _snapshot_value(value):
+    # values of fields like JSONField can be changed in place
+    if isinstance(value, (dict, list, set)):
+        return copy.deepcopy(value)
+    return value
+
+
+class ChangeTrackingMixin(object):
+    """
+    Model mixin which remembers the values of the fields of an instance as
+    they were loaded from the database, so changes are known without
+    querying the old row.
+
+    `get_dirty_fields` tells which fields changed and `get_changes` is the
+    equivalent of `get_changes_between_objects` against the loaded row.
+
+    Set `save_dirty_fields_only` to `True` on the model so that when an
+    instance loaded from the database is saved without explicit
+    `update_fields`, only the changed columns, plus `auto_now` ones, are
+    written. If nothing changed, nothing is written and no signals are sent,
+    like `save(update_fields=[])`. Beware that the changed fields are known
+    before saving, so values set by `pre_save` receivers or by the
+    `pre_save` of other fields are not written, and that saving an instance
+    whose row was deleted raises `DatabaseError` instead of inserting it.
+
+    Instances which were not loaded from the database have no snapshot, so
+    all their fields count as changed.
+    """
+
+    save_dirty_fields_only = False
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(ChangeTrackingMixin, cls).from_db(db, field_names, values)
+        instance._take_snapshot()
+        return instance
+
+    def _take_snapshot(self, fields=None):
+        """
+        Remember the current values of the given concrete fields, or of all
+        loaded ones. Deferred fields are not loaded, so they are skipped.
+        """
+        values = self.__dict__
+        snapshot = self.__dict__.setdefault('_snapshot', {})
+        if fields is None:
+            fields = self._meta.concrete_fields
+        for field in fields:
+            if field.attname in values:
+                snapshot[field.attname] = _snapshot_value(values[field.attname])
+
+    def get_dirty_fields(self):
+        """
+        Return a dict of the names of changed concrete fields to their value
+        when loaded, which is `DEFERRED` if it is not known. Related fields
+        are compared by primary key, so this never queries the database.
+        """
+        snapshot = self.__dict__.get('_snapshot', {})
+        values = self.__dict__
+        dirty = {}
+        for field in self._meta.concrete_fields:
+            attname = field.attname
+            if attname not in values:
+                continue
+            old = snapshot.get(attname, models.DEFERRED)
+            if old is models.DEFERRED or old != values[attname]:
+                dirty[field.name] = old
+        return dirty
+
+    def is_dirty(self):
+        return bool(self.get_dirty_fields())
+
+    def get_changes(self, excludes=[]):
+        """
+        Return the changes since the instance was loaded, like
+        `get_changes_between_objects`, as a dict of verbose names of fields
+        to `(old, new)` values. See `get_changes_for_objects` to get the
+        changes of many instances with the same number of queries.
+        """
+        return get_changes_for_objects([self], excludes)[0]
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if (
+            update_fields is None
+            and self.save_dirty_fields_only
+            and not args
+            and not kwargs.get('force_insert')
+            and not self._state.adding
+            and '_snapshot' in self.__dict__
+        ):
+            dirty = self.get_dirty_fields()
+            if self._meta.pk.name not in dirty:
+                if dirty:
+                    dirty.update(
+                        (field.name, None)
+                        for field in self._meta.concrete_fields
+                        if getattr(field, 'auto_now', False)
+                    )
+                kwargs['update_fields'] = list(dirty)
+                update_fields = kwargs['update_fields']
+        super(ChangeTrackingMixin, self).save(*args, **kwargs)
+        if update_fields is None:
+            self._take_snapshot()
+        else:
+            self._take_snapshot(
+                [self._meta.get_field(name) for name in update_fields]
+            )
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super(ChangeTrackingMixin, self).refresh_from_db(
+            using=using, fields=fields, **kwargs
+        )
+        if fields is None:
+            self._take_snapshot()
+        else:
+            self._take_snapshot([self._meta.get_field(name) for name in fields])
+
+
+def get_changes_for_objects(objects, excludes=[]):
+    """
+    Return the changes of each of the given `ChangeTrackingMixin`
+    instances since they were loaded, in a list of dicts like
+    `get_changes_between_objects`. Changed related objects of all instances
+    are fetched in one query per related model, or taken from the instance
+    if it already has them.
+    """
+    result = []
+    pending = []
+    for obj in objects:
+        changes = {}
+        dirty = obj.get_dirty_fields()
+        for name, old_val in dirty.items():
+            field = obj._meta.get_field(name)
+            if not _is_tracked(field, excludes):
+                continue
+            if old_val is models.DEFERRED:
+                old_val = None
+            new_val = field.value_from_object(obj)
+            if not field.is_relation:
+                if not (not old_val and not new_val):
                     changes[field.verbose_name] = (old_val, new_val)
+            else:
+                new_obj = field.get_cached_value(obj, default=None)
+                if new_obj is not None and new_obj.pk != new_val:
+                    new_obj = None
+                pending.append(
+                    (changes, field.verbose_name, field, old_val, new_val, new_obj)
+                )
+        result.append(changes)
 
-    return changes
+    _resolve_related(pending)
+    return result
 
 
 class SerialField(models.IntegerField):
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import time
+
+from django.core.management import BaseCommand
+from django.test import RequestFactory
+
+from django_commons.utils.req import TrustedProxies, get_client_ip
+
+
+class Command(BaseCommand):
+    """
+    Measure the throughput of client IP resolution with trusted proxies,
+    in lookups per second, for `X-Forwarded-For` chains of growing length.
+    """
+
+    help = "Benchmark client IP resolution over long X-Forwarded-For chains"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lookups',
+            action='store',
+            dest='lookups',
+            type=int,
+            default=100000,
+            help='Number of lookups for each chain length',
+        )
+        parser.add_argument(
+            '--networks',
+            action='store',
+            dest='networks',
+            type=int,
+            default=1000,
+            help='Number of trusted proxy networks',
+        )
+
+    def handle(self, *args, **options):
+        count = options['lookups']
+        # disjoint /24 networks in 10.0.0.0/8, plus some IPv6 ones
+        networks = [
+            '10.{}.{}.0/24'.format(i // 256, i % 256)
+            for i in range(options['networks'])
+        ]
+        networks.extend('2001:db8:{:x}::/48'.format(i) for i in range(100))
+        proxies = TrustedProxies(networks)
+
+        for length in (1, 10, 100):
+            hops = ['203.0.113.7'] + [
+                '10.{}.{}.1'.format(i // 256 % 4, i % 256) for i in range(length - 1)
+            ]
+            forwarded_for = ', '.join(hops)
+            start = time.perf_counter()
+            for _ in range(count):
+                proxies.resolve('10.0.0.1', forwarded_for)
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                "{} hops: {:.0f} lookups/s".format(length, count / elapsed)
+            )
+
+        request = RequestFactory().get(
+            '/', REMOTE_ADDR='127.0.0.1', HTTP_X_FORWARDED_FOR='203.0.113.7'
+        )
+        start = time.perf_counter()
+        for _ in range(count):
+            get_client_ip(request)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            "memoized on request: {:.0f} lookups/s".format(count / elapsed)
+        )
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import logging
+import time
+
+from django.core.management import BaseCommand, CommandError
+from django.test import RequestFactory
+
+from django_commons.logging import JSONFormatter
+
+
+class Command(BaseCommand):
+    """
+    Measure the throughput of `JSONFormatter`, in records per second.
+    """
+
+    help = "Benchmark the JSON log formatter with each available JSON library"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--records',
+            action='store',
+            dest='records',
+            type=int,
+            default=100000,
+            help='Number of records to format for each library',
+        )
+        parser.add_argument(
+            '--library',
+            action='append',
+            dest='libraries',
+            default=None,
+            help='JSON library to benchmark, can be repeated. Default is all.',
+        )
+
+    def make_record(self):
+        request = RequestFactory().get(
+            '/search/', {'q': 'term'}, HTTP_X_FORWARDED_FOR='10.0.0.1, 10.0.0.2'
+        )
+        record = logging.LogRecord(
+            'django.request',
+            logging.WARNING,
+            __file__,
+            42,
+            'slow response for %s: %.2f seconds',
+            ('/search/', 1.5),
+            None,
+        )
+        record.request = request
+        record.username = 'someone'
+        return record
+
+    def handle(self, *args, **options):
+        count = options['records']
+        record = self.make_record()
+        for library in options['libraries'] or ['orjson', 'ujson', 'json']:
+            try:
+                formatter = JSONFormatter(json_library=library)
+            except ImportError:
+                if options['libraries']:
+                    raise CommandError("'{}' is not installed".format(library))
+                self.stdout.write("{}: not installed".format(library))
+                continue
+            start = time.perf_counter()
+            for _ in range(count):
+                formatter.format(record)
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                "{}: {:.0f} records/s".format(library, count / elapsed)
+            )
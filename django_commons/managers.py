@@ -6,7 +6,7 @@ from django.db import models
 from django.db.models.manager import EmptyManager
 from django.db.models.query import EmptyQuerySet
 
-from .middleware.thread_locals import get_current_user
+from .middleware.thread_locals import get_current_user, get_request_cache
 
 
 def get_user_manager(**kwargs):
@@ -36,6 +36,38 @@ def get_user_manager(**kwargs):
 
             super(UserSubsetManager, self).__init__()
 
+        def is_exempt(self, user):
+            """
+            Return whether the user can access all records.
+
+            Permission checks are memoized for the current request, since
+            this is called for every queryset, including every related
+            object access. The permissions of the user are loaded once per
+            request.
+            """
+            if self.exempt_superuser and user.is_superuser:
+                return True
+            if self.exempt_staff and user.is_staff:
+                return True
+            if not self.exempt_perm:
+                return False
+
+            cache = get_request_cache()
+            if cache is None:
+                return user.has_perm(self.exempt_perm)
+            key = ('user_subset_exempt', user.pk, self.exempt_perm)
+            try:
+                return cache[key]
+            except KeyError:
+                pass
+            warmed_key = ('user_perms_warmed', user.pk)
+            if warmed_key not in cache:
+                # fills the permission cache of the user object
+                user.get_all_permissions()
+                cache[warmed_key] = True
+            exempt = cache[key] = user.has_perm(self.exempt_perm)
+            return exempt
+
         def get_queryset(self):
             """
             Limit the quesryset to set of records with a relation to the
@@ -50,11 +82,7 @@ def get_user_manager(**kwargs):
             if not current_user or not current_user.is_active:
                 # return EmptyQuerySet()  # model attribute will be set to None
                 return super(UserSubsetManager, self).get_queryset().none()
-            if self.exempt_superuser and current_user.is_superuser:
-                return super(UserSubsetManager, self).get_queryset()
-            if self.exempt_staff and current_user.is_staff:
-                return super(UserSubsetManager, self).get_queryset()
-            if self.exempt_perm and current_user.has_perm(self.exempt_perm):
+            if self.is_exempt(current_user):
                 return super(UserSubsetManager, self).get_queryset()
 
             filter_params = {self.user_rel: current_user}
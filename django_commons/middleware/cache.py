@@ -1,7 +1,36 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
-from django.utils.cache import add_never_cache_headers
+import hashlib
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponseNotModified
+from django.utils import timezone, translation
+from django.utils.cache import add_never_cache_headers, cc_delim_re
 from django.utils.deprecation import MiddlewareMixin
+from django.utils.http import parse_etags, quote_etag
+
+logger = logging.getLogger(__name__)
+
+
+def _get_variant_parts(request):
+    """
+    Return the list of things which select a variant of a page: the url,
+    the active language, the active timezone and the user, if any.
+    """
+    user = getattr(request, 'user', None)
+    return [
+        request.build_absolute_uri(),
+        translation.get_language() or '',
+        timezone.get_current_timezone_name(),
+        str(user.pk) if user is not None and user.is_authenticated else '',
+    ]
+
+
+def _digest(parts):
+    return hashlib.md5('\n'.join(parts).encode('utf-8')).hexdigest()
 
 
 class DisableClientSideCachingMiddleware(MiddlewareMixin):
@@ -15,3 +44,352 @@ class DisableClientSideCachingMiddleware(MiddlewareMixin):
     def process_response(self, request, response):
         add_never_cache_headers(response)
         return response
+
+
+class _PageCacheMixin(object):
+    """
+    Settings and cache key shared by the two halves of the page cache.
+    """
+
+    def __init__(self, get_response=None):
+        super(_PageCacheMixin, self).__init__(get_response)
+        self.cache = caches[getattr(settings, 'PAGE_CACHE_ALIAS', 'default')]
+        self.key_prefix = getattr(settings, 'PAGE_CACHE_KEY_PREFIX', 'page')
+        self.timeout = getattr(settings, 'PAGE_CACHE_TIMEOUT', 600)
+        self.stale_timeout = getattr(settings, 'PAGE_CACHE_STALE_TIMEOUT', 60)
+        self.lock_timeout = getattr(settings, 'PAGE_CACHE_LOCK_TIMEOUT', 30)
+        self.lock_wait = getattr(settings, 'PAGE_CACHE_LOCK_WAIT', 1.0)
+        self.per_user = getattr(settings, 'PAGE_CACHE_PER_USER', False)
+        self.status_header = getattr(settings, 'PAGE_CACHE_HEADER', 'X-Cache')
+        self.vary_headers = [
+            'HTTP_' + header.upper().replace('-', '_')
+            for header in getattr(settings, 'PAGE_CACHE_VARY_HEADERS', ())
+        ]
+
+        # headers whose effect on the response is covered by the cache key.
+        # `Cookie` is not one of them, the key has no cookies in it.
+        tz_header = getattr(settings, 'TZ_HEADER_NAME', 'X-Timezone')
+        self.covered_vary_headers = set(
+            header.lower()
+            for header in ['Accept-Language', tz_header]
+            + list(getattr(settings, 'PAGE_CACHE_VARY_HEADERS', ()))
+        )
+
+
+class FetchFromPageCacheMiddleware(_PageCacheMixin, MiddlewareMixin):
+    """
+    Request half of a server-side full page cache, keyed on the url, the
+    active language, the active timezone and optionally the user. The
+    response half is `UpdatePageCacheMiddleware`, and both are needed.
+
+    Unlike Django's own cache middleware, the timezone activated by
+    `TimezoneMiddleware` or `StatelessTimezoneMiddleware` is part of the
+    cache key, so this middleware must be placed after them, and after
+    `LocaleMiddleware` and the auth middleware.
+
+    Cached pages are served for `PAGE_CACHE_TIMEOUT` seconds. After that,
+    for `PAGE_CACHE_STALE_TIMEOUT` more seconds, one request regenerates
+    the page while others are served the stale copy. On a miss, only one
+    request renders the page and others wait up to `PAGE_CACHE_LOCK_WAIT`
+    seconds for it, to avoid a stampede on expensive pages.
+
+    By default only pages for anonymous users are cached. Set
+    `PAGE_CACHE_PER_USER` to also cache pages per user. Add more request
+    headers to the cache key in `PAGE_CACHE_VARY_HEADERS`.
+
+    The outcome is reported in a response header named by `PAGE_CACHE_HEADER`
+    setting, one of ``HIT``, ``STALE`` or ``MISS``.
+    """
+
+    def get_cache_key(self, request):
+        parts = _get_variant_parts(request)
+        parts.extend(request.META.get(header, '') for header in self.vary_headers)
+        return '{}.{}'.format(self.key_prefix, _digest(parts))
+
+    def get_user(self, request):
+        """
+        Return the user of the request, without marking the session as
+        accessed, since the user is part of the cache key and this alone
+        should not make the response vary on cookies.
+        """
+        session = getattr(request, 'session', None)
+        if session is None:
+            return getattr(request, 'user', None)
+        accessed = session.accessed
+        try:
+            user = getattr(request, 'user', None)
+            if user is not None:
+                # evaluate the lazy user, so it is not loaded again
+                user.is_authenticated
+            return user
+        finally:
+            session.accessed = accessed
+
+    def is_cacheable_request(self, request):
+        if request.method not in ('GET', 'HEAD'):
+            return False
+        user = self.get_user(request)
+        if user is not None and user.is_authenticated and not self.per_user:
+            return False
+        return True
+
+    def _serve(self, response, status):
+        response[self.status_header] = status
+        return response
+
+    def _wait_for_entry(self, key):
+        deadline = time.time() + self.lock_wait
+        while time.time() < deadline:
+            time.sleep(0.05)
+            entry = self.cache.get(key)
+            if entry is not None:
+                return entry
+        return None
+
+    def process_request(self, request):
+        request._page_cache_key = None
+        request._page_cache_lock = None
+        if not self.is_cacheable_request(request):
+            return None
+
+        key = self.get_cache_key(request)
+        lock_key = key + '.lock'
+        entry = self.cache.get(key)
+        if entry is not None:
+            expires_at, response = entry
+            if time.time() < expires_at:
+                return self._serve(response, 'HIT')
+            if request.method != 'GET':
+                return self._serve(response, 'STALE')
+            if not self.cache.add(lock_key, 1, self.lock_timeout):
+                # someone else is already regenerating this page
+                return self._serve(response, 'STALE')
+        elif request.method != 'GET':
+            return None
+        elif not self.cache.add(lock_key, 1, self.lock_timeout):
+            entry = self._wait_for_entry(key)
+            if entry is not None:
+                return self._serve(entry[1], 'HIT')
+            # render without updating the cache, the lock holder will do
+            return None
+
+        request._page_cache_key = key
+        request._page_cache_lock = lock_key
+        return None
+
+
+class UpdatePageCacheMiddleware(_PageCacheMixin, MiddlewareMixin):
+    """
+    Response half of the page cache of `FetchFromPageCacheMiddleware`,
+    which stores the pages it asked for.
+
+    This must be the first middleware, so that it sees the final response,
+    after the session, CSRF and other middleware added their cookies and
+    `Vary` headers. Responses are not cached if they set cookies, vary on
+    ``Cookie`` or on request headers not in the cache key, used the session
+    or the CSRF token, or are not cacheable according to their
+    `Cache-Control` header, since they may be specific to the client.
+    """
+
+    def is_cacheable_response(self, request, response):
+        if request.method != 'GET' or response.status_code != 200:
+            return False
+        if response.streaming or response.cookies:
+            return False
+        session = getattr(request, 'session', None)
+        if session is not None and getattr(session, 'accessed', False):
+            return False
+        if request.META.get('CSRF_COOKIE_USED') or request.META.get(
+            'CSRF_COOKIE_NEEDS_UPDATE'
+        ):
+            return False
+        cache_control = response.get('Cache-Control', '').lower()
+        if 'private' in cache_control or 'no-store' in cache_control:
+            return False
+        if response.has_header('Vary'):
+            vary = set(
+                header.strip().lower() for header in cc_delim_re.split(response['Vary'])
+            )
+            if not vary <= self.covered_vary_headers:
+                logger.debug('not caching, response varies on "%s"', response['Vary'])
+                return False
+        return True
+
+    def _release(self, request):
+        lock_key = request._page_cache_lock
+        if lock_key:
+            request._page_cache_lock = None
+            self.cache.delete(lock_key)
+
+    def _store(self, request, response):
+        try:
+            if self.is_cacheable_response(request, response):
+                entry = (time.time() + self.timeout, response)
+                self.cache.set(
+                    request._page_cache_key, entry, self.timeout + self.stale_timeout
+                )
+        finally:
+            self._release(request)
+
+    def process_response(self, request, response):
+        if not getattr(request, '_page_cache_key', None):
+            return response
+
+        response[self.status_header] = 'MISS'
+        if hasattr(response, 'render') and callable(response.render):
+            if not response.is_rendered:
+                response.add_post_render_callback(
+                    lambda r: self._store(request, r)
+                )
+                return response
+        self._store(request, response)
+        return response
+
+
+def etag_validator(validator):
+    """
+    Decorator to register a cheap validator function for a view, to be used
+    by `ETagMiddleware`.
+
+    The validator is called with the same arguments as the view and should
+    return a value which changes whenever the content of the page changes,
+    for example the result of a ``max(updated_at)`` query. If the client
+    already has the matching version, the view is not called at all. The
+    validator may return `None` to let the view run normally.
+
+        @etag_validator(lambda request: Article.objects.aggregate(Max('updated_at')))
+        def article_list(request):
+            ...
+    """
+
+    def decorator(view_func):
+        view_func.etag_validator = validator
+        return view_func
+
+    return decorator
+
+
+def _etag_matches(request, etag):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if not if_none_match:
+        return False
+    etags = parse_etags(if_none_match)
+    if '*' in etags:
+        return True
+    # weak comparison, as required for If-None-Match
+    weak = etag[2:] if etag.startswith('W/') else etag
+    return any((tag[2:] if tag.startswith('W/') else tag) == weak for tag in etags)
+
+
+class ETagMiddleware(MiddlewareMixin):
+    """
+    Set strong ETags on responses and answer conditional GET requests with
+    ``304 Not Modified``.
+
+    The ETag of a page is found in one of these ways:
+
+    * Views decorated with `etag_validator` get an ETag from the validator
+      value, before the view is called. When it matches `If-None-Match`,
+      rendering is skipped entirely.
+    * For other responses, the ETag is the hash of the content. It is
+      computed chunk by chunk, without joining the content.
+    * Streaming responses are hashed while they are sent, without buffering,
+      but by then the headers are already gone. If `ETAG_STREAMING_TIMEOUT`
+      is set, the resulting ETag is kept in the cache for that many seconds,
+      and a later request presenting it is answered with a 304 without
+      calling the view. Otherwise streaming responses are left alone.
+
+    Like `FetchFromPageCacheMiddleware`, this should be placed after the middleware
+    which activate the language, timezone and user of the request, since
+    they are part of the ETag.
+    """
+
+    # headers copied to 304 responses, as by django.utils.cache
+    NOT_MODIFIED_HEADERS = (
+        'Cache-Control',
+        'Content-Location',
+        'Date',
+        'ETag',
+        'Expires',
+        'Last-Modified',
+        'Vary',
+    )
+
+    def __init__(self, get_response=None):
+        super(ETagMiddleware, self).__init__(get_response)
+        self.cache = caches[getattr(settings, 'ETAG_CACHE_ALIAS', 'default')]
+        self.key_prefix = getattr(settings, 'ETAG_CACHE_KEY_PREFIX', 'etag')
+        self.streaming_timeout = getattr(settings, 'ETAG_STREAMING_TIMEOUT', None)
+
+    def get_cache_key(self, request):
+        return '{}.{}'.format(self.key_prefix, _digest(_get_variant_parts(request)))
+
+    def not_modified(self, etag, response=None):
+        not_modified = HttpResponseNotModified()
+        if response is not None:
+            for header in self.NOT_MODIFIED_HEADERS:
+                if response.has_header(header):
+                    not_modified[header] = response[header]
+            # cookies set by the view must still reach the client
+            not_modified.cookies = response.cookies
+        not_modified['ETag'] = etag
+        return not_modified
+
+    def process_request(self, request):
+        request._etag = None
+        if request.method not in ('GET', 'HEAD') or not self.streaming_timeout:
+            return None
+        if 'HTTP_IF_NONE_MATCH' not in request.META:
+            return None
+        etag = self.cache.get(self.get_cache_key(request))
+        if etag and _etag_matches(request, etag):
+            return self.not_modified(etag)
+        return None
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        validator = getattr(view_func, 'etag_validator', None)
+        if validator is None or request.method not in ('GET', 'HEAD'):
+            return None
+        value = validator(request, *view_args, **view_kwargs)
+        if value is None:
+            return None
+        parts = _get_variant_parts(request)
+        parts.append(str(value))
+        etag = request._etag = quote_etag(_digest(parts))
+        if _etag_matches(request, etag):
+            return self.not_modified(etag)
+        return None
+
+    def _hash_stream(self, request, content):
+        key = self.get_cache_key(request)
+        digest = hashlib.md5()
+        for chunk in content:
+            digest.update(chunk)
+            yield chunk
+        # only reached if the whole response has been sent
+        self.cache.set(key, quote_etag(digest.hexdigest()), self.streaming_timeout)
+
+    def process_response(self, request, response):
+        if request.method not in ('GET', 'HEAD') or response.status_code != 200:
+            return response
+
+        if not response.has_header('ETag'):
+            etag = getattr(request, '_etag', None)
+            if etag:
+                response['ETag'] = etag
+            elif not response.streaming:
+                digest = hashlib.md5()
+                for chunk in response:
+                    digest.update(chunk)
+                response['ETag'] = quote_etag(digest.hexdigest())
+            elif self.streaming_timeout:
+                response.streaming_content = self._hash_stream(
+                    request, response.streaming_content
+                )
+                return response
+            else:
+                return response
+
+        if _etag_matches(request, response['ETag']):
+            return self.not_modified(response['ETag'], response)
+        return response
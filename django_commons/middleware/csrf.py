@@ -1,5 +1,10 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import time
+
+from django.conf import settings
+from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.dispatch import receiver
 from django.middleware.csrf import rotate_token
 from django.utils.deprecation import MiddlewareMixin
 
@@ -7,8 +12,101 @@ from django.utils.deprecation import MiddlewareMixin
 class CSRFRotateToken(MiddlewareMixin):
     """
     Create a new CSRF token cookie on each request
+
+    This makes every response set a cookie, which makes them uncacheable.
+    See `CSRFRotationPolicyMiddleware` for a more selective alternative.
     """
 
     def process_response(self, request, response):
         rotate_token(request)
         return response
+
+
+def mark_privilege_change(request):
+    """
+    Ask `CSRFRotationPolicyMiddleware` to rotate the CSRF token at the end of
+    this request, because the privileges of the client have changed.
+
+    This is done automatically on login and logout.
+    """
+    request._csrf_privilege_changed = True
+
+
+@receiver([user_logged_in, user_logged_out])
+def _mark_auth_change(sender, request=None, **kwargs):
+    if request is not None:
+        mark_privilege_change(request)
+
+
+class CSRFRotationPolicyMiddleware(MiddlewareMixin):
+    """
+    Rotate the CSRF token only when the configured policy asks for it,
+    instead of on every response like `CSRFRotateToken`.
+
+    The token is rotated when any of these hold:
+
+    * the request method is one of `CSRF_ROTATE_METHODS`, by default the
+      unsafe methods. Set it to an empty list to disable.
+    * the privileges of the client changed during the request, i.e. login,
+      logout or an explicit call to `mark_privilege_change`, unless
+      `CSRF_ROTATE_ON_PRIVILEGE_CHANGE` is `False`.
+    * `CSRF_ROTATE_INTERVAL` is set to a number of seconds and the token is
+      older than that. The time of last rotation is kept in a cookie named
+      by `CSRF_ROTATE_COOKIE_NAME`, which is only set on rotation.
+
+    Other responses do not get a new cookie, so they can be cached.
+
+    Like `CSRFRotateToken`, this middleware must be placed after
+    `django.middleware.csrf.CsrfViewMiddleware`, so that the rotated token
+    is written by it.
+    """
+
+    def __init__(self, get_response=None):
+        super(CSRFRotationPolicyMiddleware, self).__init__(get_response)
+        self.methods = frozenset(
+            method.upper()
+            for method in getattr(
+                settings, 'CSRF_ROTATE_METHODS', ('POST', 'PUT', 'PATCH', 'DELETE')
+            )
+        )
+        self.on_privilege_change = getattr(
+            settings, 'CSRF_ROTATE_ON_PRIVILEGE_CHANGE', True
+        )
+        self.interval = getattr(settings, 'CSRF_ROTATE_INTERVAL', None)
+        self.cookie_name = getattr(settings, 'CSRF_ROTATE_COOKIE_NAME', 'csrfrotated')
+
+    def is_expired(self, request):
+        if settings.CSRF_COOKIE_NAME not in request.COOKIES:
+            # no token yet, django will issue one when needed
+            return False
+        try:
+            rotated_at = float(request.COOKIES[self.cookie_name])
+        except (KeyError, ValueError):
+            return True
+        return time.time() - rotated_at > self.interval
+
+    def should_rotate(self, request):
+        if request.method in self.methods:
+            return True
+        if self.on_privilege_change and getattr(
+            request, '_csrf_privilege_changed', False
+        ):
+            return True
+        if self.interval and self.is_expired(request):
+            return True
+        return False
+
+    def process_response(self, request, response):
+        if self.should_rotate(request):
+            rotate_token(request)
+            if self.interval:
+                response.set_cookie(
+                    self.cookie_name,
+                    str(int(time.time())),
+                    max_age=settings.CSRF_COOKIE_AGE,
+                    domain=settings.CSRF_COOKIE_DOMAIN,
+                    path=settings.CSRF_COOKIE_PATH,
+                    secure=settings.CSRF_COOKIE_SECURE,
+                    httponly=True,
+                )
+        return response
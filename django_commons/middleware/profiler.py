@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import collections
+import io
+import logging
+import os
+import random
+import re
+import signal
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+
+from .thread_locals import get_current_request, get_current_user
+
+logger = logging.getLogger(__name__)
+
+PROFILE_TOKEN_SALT = 'django_commons.middleware.profiler'
+
+_unsafe_filename_re = re.compile(r'[^A-Za-z0-9_.-]+')
+
+
+def make_profile_token():
+    """
+    Return a signed value for the profiler request header, which makes
+    `SamplingProfilerMiddleware` profile the request.
+    """
+    return signing.TimestampSigner(salt=PROFILE_TOKEN_SALT).sign('profile')
+
+
+def _collapse(frame):
+    """
+    Return the stack of the given frame in the collapsed format used by
+    flamegraph tools, outermost frame first.
+    """
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(
+            '{} ({}:{})'.format(code.co_name, code.co_filename, code.co_firstlineno)
+        )
+        frame = frame.f_back
+    names.reverse()
+    return ';'.join(names)
+
+
+class _SignalSampler(object):
+    """
+    Sample the stack of the main thread on each tick of a `SIGPROF` timer.
+
+    The timer counts CPU time of the process, so time spent waiting on I/O
+    is not sampled. Signal handlers only run in the main thread, so this can
+    only be used when requests are processed there.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self._previous_handler = None
+
+    def _handle(self, signum, frame):
+        self.stacks[_collapse(frame)] += 1
+
+    def start(self):
+        self._previous_handler = signal.signal(signal.SIGPROF, self._handle)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, self._previous_handler or signal.SIG_DFL)
+
+
+class _ThreadSampler(object):
+    """
+    Sample the stack of a given thread in wall clock intervals, from a
+    background thread.
+    """
+
+    def __init__(self, interval, thread_id):
+        self.interval = interval
+        self.thread_id = thread_id
+        self.stacks = collections.Counter()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[_collapse(frame)] += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='request-profiler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+
+class SamplingProfilerMiddleware(object):
+    """
+    Profile a sample of requests with a statistical profiler, and write the
+    result as collapsed stacks, which can be turned into a flamegraph by
+    tools like `flamegraph.pl` or speedscope.
+
+    A request is profiled if it carries a valid signed token, made by
+    `make_profile_token`, in the header named by `PROFILER_HEADER` setting,
+    or otherwise with the probability given in `PROFILER_SAMPLE_RATE`.
+    Tokens expire after `PROFILER_TOKEN_MAX_AGE` seconds. Requests which are
+    not profiled only cost a header lookup and a random number.
+
+    Stacks are sampled every `PROFILER_INTERVAL` seconds, with a `SIGPROF`
+    timer if the request is processed in the main thread, or with a sampler
+    thread otherwise. Profiles are written in `PROFILER_OUTPUT_DIR`, and
+    the middleware is disabled if it is not set. File names are tagged with
+    the user and the path from the request context, so this middleware
+    should be placed after `RequestContextMiddleware` or `TLSRequest`.
+    """
+
+    sync_capable = True
+    async_capable = False
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.output_dir = getattr(settings, 'PROFILER_OUTPUT_DIR', None)
+        if not self.output_dir:
+            raise MiddlewareNotUsed('PROFILER_OUTPUT_DIR is not set')
+        self.sample_rate = getattr(settings, 'PROFILER_SAMPLE_RATE', 0.0)
+        self.interval = getattr(settings, 'PROFILER_INTERVAL', 0.005)
+        self.token_max_age = getattr(settings, 'PROFILER_TOKEN_MAX_AGE', 3600)
+        header_name = getattr(settings, 'PROFILER_HEADER', 'X-Profile')
+        self.header_key = 'HTTP_' + header_name.upper().replace('-', '_')
+        self.signer = signing.TimestampSigner(salt=PROFILE_TOKEN_SALT)
+        self.use_signal = hasattr(signal, 'setitimer')
+
+    def should_profile(self, request):
+        token = request.META.get(self.header_key)
+        if token:
+            try:
+                self.signer.unsign(token, max_age=self.token_max_age)
+                return True
+            except signing.BadSignature:
+                logger.debug('ignoring invalid profiler token')
+        return bool(self.sample_rate) and random.random() < self.sample_rate
+
+    def get_sampler(self):
+        if self.use_signal and threading.current_thread() is threading.main_thread():
+            return _SignalSampler(self.interval)
+        return _ThreadSampler(self.interval, threading.current_thread().ident)
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        sampler = self.get_sampler()
+        sampler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            sampler.stop()
+        try:
+            self.write_profile(request, sampler.stacks)
+        except (IOError, OSError) as e:
+            logger.exception(e)
+        return response
+
+    def get_profile_path(self, request):
+        current_request = get_current_request() or request
+        user = get_current_user() or getattr(current_request, 'user', None)
+        if user is not None and user.is_authenticated:
+            username = user.get_username()
+        else:
+            username = 'anon'
+        tag = _unsafe_filename_re.sub(
+            '_', '{}-{}'.format(username, current_request.path)
+        ).strip('_')
+        filename = '{}-{}-{}-{}.collapsed'.format(
+            time.strftime('%Y%m%d%H%M%S'),
+            os.getpid(),
+            threading.current_thread().ident,
+            tag[:100],
+        )
+        return os.path.join(self.output_dir, filename)
+
+    def write_profile(self, request, stacks):
+        path = self.get_profile_path(request)
+        with io.open(path, 'w', encoding='utf-8') as f:
+            for stack, count in sorted(stacks.items()):
+                f.write('{} {}\n'.format(stack, count))
+        logger.info('wrote profile of %d samples to "%s"', sum(stacks.values()), path)
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import collections
+import logging
+import math
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.deprecation import MiddlewareMixin
+
+from ..utils.req import get_client_ip
+
+logger = logging.getLogger(__name__)
+
+_rate_re = re.compile(r'^\s*(\d+)\s*/\s*(\d*)\s*([a-z]+)\s*$')
+_PERIODS = dict(
+    (unit, seconds)
+    for names, seconds in [
+        (('s', 'sec', 'second', 'seconds'), 1),
+        (('m', 'min', 'minute', 'minutes'), 60),
+        (('h', 'hour', 'hours'), 3600),
+        (('d', 'day', 'days'), 86400),
+    ]
+    for unit in names
+)
+
+
+class Rate(object):
+    """
+    A limit of `limit` requests per `period` seconds, parsed from strings
+    like ``100/m``, ``5/10s`` or ``1000/hour``.
+    """
+
+    def __init__(self, value, methods=None, key='user_or_ip'):
+        match = _rate_re.match(value)
+        if not match or match.group(3) not in _PERIODS:
+            raise ValueError('invalid rate "{}"'.format(value))
+        limit, multiplier, unit = match.groups()
+        self.value = value
+        self.limit = int(limit)
+        self.period = int(multiplier or 1) * _PERIODS[unit]
+        if self.limit < 1 or self.period < 1:
+            # buckets would never refill, block such views in the view itself
+            raise ValueError('invalid rate "{}"'.format(value))
+        # tokens added to a bucket per second
+        self.refill = float(self.limit) / self.period
+        self.methods = (
+            None if methods is None else frozenset(m.upper() for m in methods)
+        )
+        self.key = key
+
+    def get_key(self, request):
+        """
+        Return what is limited for the request: the user if authenticated,
+        otherwise the IP address of the client, unless asked otherwise.
+        """
+        if callable(self.key):
+            return self.key(request)
+        if self.key != 'ip':
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated:
+                return 'u{}'.format(user.pk)
+        return 'ip{}'.format(get_client_ip(request))
+
+
+def rate_limit(rate, methods=None, key='user_or_ip'):
+    """
+    Decorator to set the rate limit of a view, applied by
+    `RateLimitMiddleware`, which overrides the configured ones.
+
+    `key` is one of ``user_or_ip`` or ``ip``, or a function which takes the
+    request and returns what to limit it by. Limits may apply only to some
+    `methods`. Pass `None` as `rate` to exempt a view.
+
+        @rate_limit('10/m', methods=['POST'])
+        def login(request):
+            ...
+    """
+    limit = None if rate is None else Rate(rate, methods, key)
+
+    def decorator(view_func):
+        view_func.rate_limit = limit
+        return view_func
+
+    return decorator
+
+
+class TokenBuckets(object):
+    """
+    Token buckets of this process, in a table of at most `max_size` keys,
+    evicting the least recently used ones.
+
+    Each bucket is a `[tokens, last update]` pair. Full buckets are not
+    worth keeping, so evicting one only forgets a partially used bucket.
+    """
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._buckets = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, now=None):
+        """
+        Take a token from the bucket of the key, and return `0` if there was
+        one, or the number of seconds until there will be one.
+        """
+        if now is None:
+            now = time.monotonic()
+        buckets = self._buckets
+        with self._lock:
+            bucket = buckets.get(key)
+            if bucket is None:
+                if len(buckets) >= self.max_size:
+                    buckets.popitem(last=False)
+                buckets[key] = [rate.limit - 1.0, now]
+                return 0
+            buckets.move_to_end(key)
+            tokens = bucket[0] + (now - bucket[1]) * rate.refill
+            if tokens > rate.limit:
+                tokens = rate.limit
+            bucket[1] = now
+            if tokens < 1.0:
+                bucket[0] = tokens
+                return (1.0 - tokens) / rate.refill
+            bucket[0] = tokens - 1.0
+            return 0
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class RateLimitMiddleware(MiddlewareMixin):
+    """
+    Throttle requests per user, or per client IP address for anonymous
+    users, and answer ``429 Too Many Requests`` with a `Retry-After` header
+    when the limit is exceeded.
+
+    The limit of a view is, in order of precedence, the one set with the
+    `rate_limit` decorator, the one for its url name in `RATELIMIT_VIEWS`
+    setting, or `RATELIMIT_DEFAULT`, which is unset by default so only the
+    configured views are limited. Limits are strings like ``100/m``, and
+    requests are counted separately for each view.
+
+    Limits are enforced with token buckets in the memory of each process,
+    allowing bursts up to the limit, in a table of at most
+    `RATELIMIT_MAX_KEYS` keys. This costs a few microseconds per request.
+    Since each process counts on its own, set `RATELIMIT_CACHE` to a cache
+    alias to also count requests of all processes in fixed windows in that
+    cache, at the cost of one cache round trip per limited request.
+
+    Client IP addresses are found by `utils.req.get_client_ip`, so make sure
+    `TRUSTED_PROXIES` is set when behind proxies, or all clients of a proxy
+    share a limit. This middleware must be placed after the auth middleware.
+    """
+
+    def __init__(self, get_response=None):
+        super(RateLimitMiddleware, self).__init__(get_response)
+        default = getattr(settings, 'RATELIMIT_DEFAULT', None)
+        self.default = Rate(default) if default else None
+        self.view_rates = dict(
+            (name, Rate(rate) if rate else None)
+            for name, rate in getattr(settings, 'RATELIMIT_VIEWS', {}).items()
+        )
+        self.buckets = TokenBuckets(getattr(settings, 'RATELIMIT_MAX_KEYS', 10000))
+        alias = getattr(settings, 'RATELIMIT_CACHE', None)
+        self.cache = caches[alias] if alias else None
+        self.key_prefix = getattr(settings, 'RATELIMIT_KEY_PREFIX', 'ratelimit')
+        # rates by view function and url name, which do not change
+        self._rates = {}
+
+    def get_rate(self, request, view_func):
+        """
+        Return the rate of the view and the scope in which it is counted,
+        which is the url name, or the view function if it has none.
+        """
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match is not None else None
+        try:
+            return self._rates[view_func, view_name]
+        except KeyError:
+            pass
+        if hasattr(view_func, 'rate_limit'):
+            rate = view_func.rate_limit
+        else:
+            rate = self.view_rates.get(view_name, self.default)
+        scope = view_name or '{}.{}'.format(
+            view_func.__module__, getattr(view_func, '__name__', 'view')
+        )
+        result = self._rates[view_func, view_name] = (rate, scope)
+        return result
+
+    def count_shared(self, key, rate, now):
+        """
+        Count the request in the shared cache and return `0` if it is within
+        the limit, or the number of seconds until the current window ends.
+        """
+        window = int(now // rate.period)
+        cache_key = '{}.{}.{}'.format(self.key_prefix, key, window)
+        try:
+            count = self.cache.incr(cache_key)
+        except ValueError:
+            if self.cache.add(cache_key, 1, rate.period + 1):
+                count = 1
+            else:
+                count = self.cache.incr(cache_key)
+        if count > rate.limit:
+            return (window + 1) * rate.period - now
+        return 0
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        rate, scope = self.get_rate(request, view_func)
+        if rate is None:
+            return None
+        if rate.methods is not None and request.method not in rate.methods:
+            return None
+
+        key = '{}.{}'.format(scope, rate.get_key(request))
+        wait = self.buckets.take(key, rate)
+        if not wait and self.cache is not None:
+            wait = self.count_shared(key, rate, time.time())
+        if not wait:
+            return None
+
+        logger.debug('rate limit of %s exceeded by "%s"', rate.value, key)
+        response = HttpResponse(
+            'Too many requests', status=429, content_type='text/plain'
+        )
+        response['Retry-After'] = str(int(math.ceil(wait)))
+        return response
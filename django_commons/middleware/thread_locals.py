@@ -1,20 +1,50 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import asyncio
+from contextvars import ContextVar
 from threading import local
 
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ImproperlyConfigured, PermissionDenied
 from django.utils.deprecation import MiddlewareMixin
 
+try:
+    from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+except ImportError:
+    iscoroutinefunction = asyncio.iscoroutinefunction
+    markcoroutinefunction = None
+
 _thread_locals = local()
 
+# the request being processed in the current thread or coroutine
+_current_request = ContextVar('django_commons_current_request', default=None)
+
 
 def get_current_request():
     """
-    returns the request object for this thread
+    returns the request object for this thread or coroutine
+    """
+    request = _current_request.get()
+    if request is None:
+        request = getattr(_thread_locals, 'request', None)
+    return request
+
+
+def get_request_cache(request=None):
+    """
+    returns a dict for memoizing values for the lifetime of the given or the
+    current request, or None if there is no request
     """
-    return getattr(_thread_locals, 'request', None)
+    if request is None:
+        request = get_current_request()
+    if request is None:
+        return None
+    try:
+        return request._commons_cache
+    except AttributeError:
+        cache = request._commons_cache = {}
+        return cache
 
 
 def get_current_user():
@@ -31,6 +61,9 @@ def get_current_user():
 class TLSRequest(MiddlewareMixin):
     """
     Simple middleware that adds the request object in thread local storage.
+
+    This only works when each request is processed in its own thread. Use
+    `RequestContextMiddleware` when serving with ASGI or async views.
     """
 
     def process_request(self, request):
@@ -53,3 +86,53 @@ class TLSRequest(MiddlewareMixin):
         """To avoid leaking thread local storage to next request"""
         if hasattr(_thread_locals, 'request'):
             del _thread_locals.request
+
+
+class RequestContextMiddleware(object):
+    """
+    Middleware that makes the request object available through
+    `get_current_request` and `get_current_user`, using a context variable.
+
+    Unlike `TLSRequest`, this works for both WSGI and ASGI, since every
+    coroutine and every thread running a sync view on behalf of an async
+    request sees its own request.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self._is_async = iscoroutinefunction(get_response)
+        if self._is_async:
+            # let django know it can await this middleware
+            if markcoroutinefunction is not None:
+                markcoroutinefunction(self)
+            else:
+                self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def check_request(self, request):
+        if not hasattr(request, 'user'):
+            raise ImproperlyConfigured(
+                "'{}' needs to be placed after django auth middleware".format(
+                    self.__class__
+                )
+            )
+
+    def __call__(self, request):
+        if self._is_async:
+            return self.__acall__(request)
+        self.check_request(request)
+        token = _current_request.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            _current_request.reset(token)
+
+    async def __acall__(self, request):
+        self.check_request(request)
+        token = _current_request.set(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            _current_request.reset(token)
@@ -3,14 +3,18 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 import logging
 
-import pytz
-
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 from django.utils import timezone
+from django.utils.cache import patch_vary_headers
 from django.utils.deprecation import MiddlewareMixin
 
+from ..utils.date_time import get_timezone
+
 logger = logging.getLogger(__name__)
 
+TZ_COOKIE_SALT = 'django_commons.middleware.timezone'
+
 
 class TimezoneMiddleware(MiddlewareMixin):
     """
@@ -28,6 +32,10 @@ class TimezoneMiddleware(MiddlewareMixin):
     sources which can help choose a timezone.
     """
 
+    def __init__(self, get_response=None):
+        super(TimezoneMiddleware, self).__init__(get_response)
+        self.tz_session_key = getattr(settings, 'TZ_SESSION_KEY', 'request_timezone')
+
     def process_request(self, request):
         if not hasattr(request, 'session'):
             logger.warn(
@@ -35,32 +43,127 @@ class TimezoneMiddleware(MiddlewareMixin):
             )
             return
 
-        tz_session_key = getattr(settings, 'TZ_SESSION_KEY', 'request_timezone')
-        tz_name = request.session.get(tz_session_key)
+        tz_name = request.session.get(self.tz_session_key)
         if tz_name:
             try:
                 # sets the time zone for the current thread
-                timezone.activate(pytz.timezone(tz_name))
-                logger.debug(
-                    'setting tz from session. current tz: "{}"'.format(
-                        timezone.get_current_timezone()
-                    )
-                )
+                tz = get_timezone(tz_name)
+                timezone.activate(tz)
+                logger.debug('setting tz from session. current tz: "%s"', tz)
             except Exception as e:
                 logger.exception(e)
         else:
+            # the default timezone set in django settings is in effect
+            # when no other timezone is active
+            timezone.deactivate()
+            logger.debug('setting tz to default')
+
+    def process_response(self, request, response):
+        # unsets the time zone for the current thread
+        timezone.deactivate()
+        return response
+
+
+def set_timezone_cookie(response, tz_name, **kwargs):
+    """
+    Set the signed cookie read by `StatelessTimezoneMiddleware` on the given
+    response. Extra keyword arguments are passed to `set_signed_cookie`.
+    """
+    cookie_name = getattr(settings, 'TZ_COOKIE_NAME', 'request_timezone')
+    response.set_signed_cookie(cookie_name, tz_name, salt=TZ_COOKIE_SALT, **kwargs)
+
+
+class StatelessTimezoneMiddleware(MiddlewareMixin):
+    """
+    Activate a particular timezone per request, without depending on
+    sessions.
+
+    `TimezoneMiddleware` loads the session on every request, which costs
+    a hit on the session backend and makes responses vary on cookie. This
+    middleware instead tries the sources listed in `TZ_SOURCES` setting in
+    order, ``('path', 'header')`` by default, and activates the first valid
+    timezone found:
+
+    * ``path``: a leading path segment looked up in the `TZ_URL_PREFIXES`
+      dict of prefixes to timezone names. The prefix is removed from
+      `request.path_info` before url resolution and kept in
+      `request.timezone_url_prefix`.
+    * ``header``: a request header named by `TZ_HEADER_NAME` setting,
+      ``X-Timezone`` by default, usually set by the frontend.
+    * ``cookie``: a signed cookie named by `TZ_COOKIE_NAME` setting, which
+      can be set by `set_timezone_cookie`.
+
+    If none of them is present, the default timezone is in effect.
+
+    Responses get a `Vary` header for each header or cookie source that was
+    consulted, so a page cache keeps a separate copy per timezone. The
+    cookie source is opt-in, since it makes every response which gets that
+    far vary on ``Cookie``, which page caches refuse to store.
+    """
+
+    SOURCES = ('path', 'header', 'cookie')
+    DEFAULT_SOURCES = ('path', 'header')
+
+    def __init__(self, get_response=None):
+        super(StatelessTimezoneMiddleware, self).__init__(get_response)
+        self.sources = tuple(getattr(settings, 'TZ_SOURCES', self.DEFAULT_SOURCES))
+        unknown = set(self.sources) - set(self.SOURCES)
+        if unknown:
+            raise ImproperlyConfigured(
+                'unknown timezone sources: {}'.format(', '.join(sorted(unknown)))
+            )
+        self.url_prefixes = getattr(settings, 'TZ_URL_PREFIXES', {})
+        self.header_name = getattr(settings, 'TZ_HEADER_NAME', 'X-Timezone')
+        self.header_key = 'HTTP_' + self.header_name.upper().replace('-', '_')
+        self.cookie_name = getattr(settings, 'TZ_COOKIE_NAME', 'request_timezone')
+
+        # resolve the getters and the vary header of each source only once
+        vary = {'path': None, 'header': self.header_name, 'cookie': 'Cookie'}
+        self._lookups = [
+            (source, getattr(self, 'get_timezone_from_' + source), vary[source])
+            for source in self.sources
+        ]
+
+    def get_timezone_from_path(self, request):
+        prefix, _, rest = request.path_info.lstrip('/').partition('/')
+        tz_name = self.url_prefixes.get(prefix)
+        if tz_name:
+            request.path_info = '/' + rest
+            request.timezone_url_prefix = prefix
+        return tz_name
+
+    def get_timezone_from_header(self, request):
+        return request.META.get(self.header_key)
+
+    def get_timezone_from_cookie(self, request):
+        return request.get_signed_cookie(
+            self.cookie_name, default=None, salt=TZ_COOKIE_SALT
+        )
+
+    def process_request(self, request):
+        vary = []
+        for source, get_tz_name, vary_header in self._lookups:
+            if vary_header:
+                vary.append(vary_header)
+            tz_name = get_tz_name(request)
+            if not tz_name:
+                continue
             try:
-                # activate the timezone set in django settings as a default
-                timezone.activate(timezone.get_default_timezone())
-                logger.debug(
-                    'setting tz to default. current tz: "{}"'.format(
-                        timezone.get_current_timezone()
-                    )
-                )
-            except Exception as e:
-                logger.exception(e)
+                tz = get_timezone(tz_name)
+            except (KeyError, ValueError):
+                logger.debug('ignoring unknown timezone "%s" from %s', tz_name, source)
+                continue
+            timezone.activate(tz)
+            logger.debug('setting tz from %s. current tz: "%s"', source, tz)
+            break
+        else:
+            timezone.deactivate()
+        request._timezone_vary_headers = vary
 
     def process_response(self, request, response):
         # unsets the time zone for the current thread
         timezone.deactivate()
+        vary = getattr(request, '_timezone_vary_headers', None)
+        if vary:
+            patch_vary_headers(response, vary)
         return response
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import bisect
+import logging
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# upper bounds of histogram buckets in seconds, growing by 25% from 0.1ms
+# up to a minute
+_BUCKET_BOUNDS = []
+_bound = 0.0001
+while _bound < 60:
+    _BUCKET_BOUNDS.append(_bound)
+    _bound *= 1.25
+_BUCKET_BOUNDS.append(float('inf'))
+
+
+class Histogram(object):
+    """
+    A thread-safe histogram of durations with fixed, logarithmic buckets.
+
+    Percentiles are estimated as the upper bound of the bucket they fall
+    in, which is within 25% of the real value.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = [0] * len(_BUCKET_BOUNDS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value):
+        index = bisect.bisect_left(_BUCKET_BOUNDS, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += value
+            if value > self.max:
+                self.max = value
+
+    def percentile(self, fraction):
+        with self._lock:
+            counts = list(self.counts)
+            count = self.count
+            maximum = self.max
+        if not count:
+            return None
+        threshold = fraction * count
+        seen = 0
+        for bound, bucket_count in zip(_BUCKET_BOUNDS, counts):
+            seen += bucket_count
+            if seen >= threshold:
+                return min(bound, maximum)
+        return maximum
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'p50': self.percentile(0.50),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+            'max': self.max,
+        }
+
+
+# histograms of this process, keyed by view name and metric name
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+
+def record_timing(view_name, metric, value):
+    key = (view_name, metric)
+    try:
+        histogram = _histograms[key]
+    except KeyError:
+        with _histograms_lock:
+            histogram = _histograms.setdefault(key, Histogram())
+    histogram.record(value)
+
+
+def get_timing_stats():
+    """
+    Return the summary of request timings recorded in this process, as a
+    dict of view names to dicts of metric names to their summary.
+    """
+    stats = {}
+    for (view_name, metric), histogram in sorted(_histograms.items()):
+        stats.setdefault(view_name, {})[metric] = histogram.summary()
+    return stats
+
+
+def reset_timing_stats():
+    with _histograms_lock:
+        _histograms.clear()
+
+
+class RequestTiming(object):
+    """
+    Timings collected during a single request.
+    """
+
+    def __init__(self):
+        self.view_name = None
+        self.db_count = 0
+        self.db_time = 0.0
+        self.template_start = None
+        self.template_time = 0.0
+        self.middleware_times = {}
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_count += 1
+            self.db_time += time.perf_counter() - start
+
+
+class _MiddlewareProbe(object):
+    """
+    Measure the time spent inside the wrapped handler, i.e. a middleware
+    and everything after it, identified by its position in the chain.
+    """
+
+    def __init__(self, index, get_response):
+        self.index = index
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            timing = getattr(request, '_timing', None)
+            if timing is not None:
+                timing.middleware_times[self.index] = time.perf_counter() - start
+
+
+class RequestTimingMiddleware(object):
+    """
+    Measure where the time of each request goes.
+
+    Records the wall time of the request, the number and time of database
+    queries on all connections, the time to render template responses and,
+    if `REQUEST_TIMING_MIDDLEWARE_PROBES` setting is enabled, the time spent
+    in each of the following middleware. Templates rendered inside views,
+    for example by `django.shortcuts.render`, count as view time.
+
+    Timings are recorded in per-view histograms of this process, which can
+    be read with `get_timing_stats`, for example through
+    `views.timing.timing_stats`. They are also sent to clients in a
+    `Server-Timing` header if `REQUEST_TIMING_HEADER` setting is enabled,
+    which it is only with `DEBUG` by default, since it tells anyone query
+    counts and middleware names.
+
+    Should be the first middleware, so it can measure all others.
+    """
+
+    sync_capable = True
+    async_capable = False
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.send_header = getattr(settings, 'REQUEST_TIMING_HEADER', settings.DEBUG)
+        self.probe_names = []
+        if getattr(settings, 'REQUEST_TIMING_MIDDLEWARE_PROBES', False):
+            self._install_probes()
+
+    def _install_probes(self):
+        """
+        Put a probe in front of each of the following middleware.
+
+        Django wraps each middleware in a function that keeps the middleware
+        instance in `__wrapped__` and the instance calls the next one through
+        its `get_response` attribute, so the chain can be walked from here.
+        """
+        owner = self
+        while True:
+            handler = owner.get_response
+            target = getattr(handler, '__wrapped__', handler)
+            owner.get_response = _MiddlewareProbe(len(self.probe_names), handler)
+            if not hasattr(target, 'get_response'):
+                # the url resolver and view, or a function based middleware
+                # which can not be walked any further
+                name = getattr(target, '__name__', 'view')
+                self.probe_names.append('view' if name == '_get_response' else name)
+                break
+            self.probe_names.append(type(target).__name__)
+            owner = target
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timing = getattr(request, '_timing', None)
+        if timing is None:
+            return None
+        match = getattr(request, 'resolver_match', None)
+        if match is not None and match.view_name:
+            timing.view_name = match.view_name
+        else:
+            timing.view_name = '{}.{}'.format(
+                view_func.__module__, getattr(view_func, '__name__', 'view')
+            )
+        return None
+
+    def process_template_response(self, request, response):
+        timing = getattr(request, '_timing', None)
+        if timing is not None:
+            timing.template_start = time.perf_counter()
+            response.add_post_render_callback(
+                lambda r: self._template_rendered(timing)
+            )
+        return response
+
+    def _template_rendered(self, timing):
+        timing.template_time = time.perf_counter() - timing.template_start
+
+    def __call__(self, request):
+        timing = request._timing = RequestTiming()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timing.execute_wrapper))
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+
+        view_name = timing.view_name or '<unresolved>'
+        record_timing(view_name, 'total', total)
+        record_timing(view_name, 'db', timing.db_time)
+        if timing.template_start is not None:
+            record_timing(view_name, 'template', timing.template_time)
+        middleware_times = self.get_middleware_self_times(timing)
+        for name, duration in middleware_times:
+            record_timing(view_name, 'mw.' + name, duration)
+
+        if self.send_header:
+            metrics = [
+                'total;dur={:.3f}'.format(total * 1000),
+                'db;dur={:.3f};desc="{} queries"'.format(
+                    timing.db_time * 1000, timing.db_count
+                ),
+            ]
+            if timing.template_start is not None:
+                metrics.append('template;dur={:.3f}'.format(timing.template_time * 1000))
+            metrics.extend(
+                'mw.{};dur={:.3f}'.format(name, duration * 1000)
+                for name, duration in middleware_times
+            )
+            response['Server-Timing'] = ', '.join(metrics)
+        return response
+
+    def get_middleware_self_times(self, timing):
+        """
+        Return the time spent in each probed middleware itself, excluding the
+        middleware after it, as a list of `(name, seconds)` in chain order.
+        """
+        times = timing.middleware_times
+        result = []
+        for index, name in enumerate(self.probe_names):
+            if index not in times:
+                # the chain was short-circuited before this point
+                break
+            result.append((name, times[index] - times.get(index + 1, 0.0)))
+        return result
@@ -1,6 +1,10 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
-from django.db import models
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.db import connections, models, router
+from django.db.models import Q
+
+from .fields import _snapshot_value
 
 
 class ValidateModelMixin(object):
@@ -17,15 +21,240 @@ class ValidateModelMixin(object):
 
     Another problem with this approach is methods like ``update``,
     ``select_for_update``, ``bulk_create``, etc. completely bypass this,
-    unless they are overridden too.
+    unless they are overridden too. Use :func:`full_clean_objects` to
+    validate instances before them.
+
+    Set ``incremental_validation`` to ``True`` on the model to make
+    :meth:`save` call :meth:`clean_changed` instead, which skips validation
+    if the instance was already validated, e.g. by a model form, and has not
+    changed since, and otherwise validates only the changed fields.
     """
 
+    incremental_validation = False
+
+    def _get_clean_values(self):
+        return dict(
+            (field.attname, _snapshot_value(self.__dict__[field.attname]))
+            for field in self._meta.concrete_fields
+            if field.attname in self.__dict__
+        )
+
+    def _get_changed_since_clean(self):
+        """
+        Return the names of fields changed since the instance was last
+        validated, or since it was loaded if it has a change tracking
+        snapshot, or None if that is not known, and whether uniqueness was
+        known to hold at that point.
+        """
+        state = self.__dict__.get('_clean_state')
+        if state is not None:
+            values, unique_checked = state
+            changed = set(
+                field.name
+                for field in self._meta.concrete_fields
+                if field.attname in self.__dict__
+                and (
+                    field.attname not in values
+                    or values[field.attname] != self.__dict__[field.attname]
+                )
+            )
+            return changed, unique_checked
+        if not self._state.adding and hasattr(self, 'get_dirty_fields'):
+            # the loaded row is trusted to be valid
+            return set(self.get_dirty_fields()), True
+        return None, False
+
+    def full_clean(self, exclude=None, validate_unique=True, *args, **kwargs):
+        super(ValidateModelMixin, self).full_clean(
+            exclude, validate_unique, *args, **kwargs
+        )
+        # excluded fields are trusted to be valid, as by model forms
+        self._clean_state = (self._get_clean_values(), validate_unique)
+
+    def validate_unique(self, exclude=None):
+        super(ValidateModelMixin, self).validate_unique(exclude)
+        state = self.__dict__.get('_clean_state')
+        if state is not None and state[0] == self._get_clean_values():
+            self._clean_state = (state[0], True)
+
+    def clean_changed(self):
+        """
+        Validate only what may have become invalid since the instance was
+        last validated or loaded: the changed fields, the model `clean`
+        method and the unique checks which involve a changed field.
+
+        Does nothing if nothing changed and uniqueness was already checked,
+        and falls back to :meth:`full_clean` if changes are not known.
+        """
+        changed, unique_checked = self._get_changed_since_clean()
+        if changed is None:
+            return self.full_clean()
+        if not changed and unique_checked:
+            return None
+
+        errors = {}
+        if changed:
+            exclude = [
+                field.name
+                for field in self._meta.fields
+                if field.name not in changed
+            ]
+            try:
+                self.clean_fields(exclude=exclude)
+            except ValidationError as e:
+                errors = e.update_error_dict(errors)
+            try:
+                self.clean()
+            except ValidationError as e:
+                errors = e.update_error_dict(errors)
+            if hasattr(self, 'validate_constraints'):
+                try:
+                    self.validate_constraints()
+                except ValidationError as e:
+                    errors = e.update_error_dict(errors)
+
+        unique_checks, date_checks = self._get_unique_checks()
+        if unique_checked:
+            unique_checks = [
+                check for check in unique_checks if changed.intersection(check[1])
+            ]
+            date_checks = [
+                check
+                for check in date_checks
+                if changed.intersection([check[2], check[3]])
+            ]
+        unique_errors = self._perform_unique_checks(unique_checks)
+        unique_errors.update(self._perform_date_checks(date_checks))
+        for name, field_errors in unique_errors.items():
+            errors.setdefault(name, []).extend(field_errors)
+        if errors:
+            raise ValidationError(errors)
+        self._clean_state = (self._get_clean_values(), True)
+
     def save(self, *args, **kwargs):
         """Call :meth:`full_clean` before saving."""
-        self.full_clean()
+        if self.incremental_validation:
+            self.clean_changed()
+        else:
+            self.full_clean()
         super(ValidateModelMixin, self).save(*args, **kwargs)
 
 
+def _unique_lookup(obj, unique_check):
+    """
+    Return the lookup of the row which would conflict with the object for
+    a unique check, or None if it can not conflict, as Django does.
+    """
+    model_class, field_names = unique_check
+    connection = connections[router.db_for_write(model_class, instance=obj)]
+    lookup = {}
+    for field_name in field_names:
+        field = obj._meta.get_field(field_name)
+        value = getattr(obj, field.attname)
+        if value is None or (
+            value == '' and connection.features.interprets_empty_strings_as_nulls
+        ):
+            return None
+        if field.primary_key and not obj._state.adding:
+            # an existing object keeps its own primary key
+            return None
+        lookup[field_name] = value
+    return lookup
+
+
+def full_clean_objects(objects, exclude=None, validate_unique=True):
+    """
+    Validate a list of model instances, e.g. before `bulk_create` or
+    `bulk_update`, and return a dict of the indexes of invalid instances to
+    their `ValidationError`, which is empty if all of them are valid.
+
+    Fields and `clean` are validated per instance, but the unique checks of
+    all instances are done in one query per model, which also catches
+    instances conflicting with each other. Checks for `unique_for_date`
+    and similar, and model constraints, are done per instance.
+    """
+    errors = {}
+    pending = []
+    for index, obj in enumerate(objects):
+        try:
+            obj.full_clean(exclude, validate_unique=False)
+        except ValidationError as e:
+            errors[index] = e.update_error_dict({})
+            continue
+        if validate_unique:
+            unique_checks, date_checks = obj._get_unique_checks(exclude=exclude)
+            date_errors = obj._perform_date_checks(date_checks)
+            if date_errors:
+                errors[index] = date_errors
+            pending.append((index, obj, unique_checks))
+
+    # lookups of the rows which would conflict, grouped by model
+    lookups = {}
+    for index, obj, unique_checks in pending:
+        for unique_check in unique_checks:
+            lookup = _unique_lookup(obj, unique_check)
+            if lookup is not None:
+                lookups.setdefault(unique_check[0], []).append(
+                    (index, obj, unique_check, lookup)
+                )
+
+    for model_class, checks in lookups.items():
+        query = Q()
+        field_names = set()
+        for index, obj, unique_check, lookup in checks:
+            query |= Q(**lookup)
+            field_names.update(unique_check[1])
+        attnames = dict(
+            (name, model_class._meta.get_field(name).attname) for name in field_names
+        )
+        rows = list(
+            model_class._default_manager.filter(query).values(
+                'pk', *sorted(set(attnames.values()))
+            )
+        )
+
+        seen = set()
+        unmatched = []
+        matched_pks = set()
+        for index, obj, unique_check, lookup in checks:
+            key = (unique_check[1], tuple(lookup[name] for name in unique_check[1]))
+            own_pk = None if obj._state.adding else obj.pk
+            matches = set(
+                row['pk']
+                for row in rows
+                if all(row[attnames[name]] == lookup[name] for name in unique_check[1])
+            )
+            matched_pks.update(matches)
+            matches.discard(own_pk)
+            if matches or key in seen:
+                if len(unique_check[1]) == 1:
+                    name = unique_check[1][0]
+                else:
+                    name = NON_FIELD_ERRORS
+                error = obj.unique_error_message(model_class, unique_check[1])
+                errors.setdefault(index, {}).setdefault(name, []).append(error)
+            else:
+                unmatched.append((index, obj, unique_check))
+            seen.add(key)
+
+        if len(matched_pks) < len(rows):
+            # the database compares some values differently than python,
+            # e.g. case insensitively, so let Django decide for the rest
+            for index, obj, unique_check in unmatched:
+                unique_errors = obj._perform_unique_checks([unique_check])
+                for name, field_errors in unique_errors.items():
+                    errors.setdefault(index, {}).setdefault(name, []).extend(
+                        field_errors
+                    )
+
+    for index, obj in enumerate(objects):
+        if index in errors:
+            errors[index] = ValidationError(errors[index])
+        elif hasattr(obj, '_get_clean_values'):
+            obj._clean_state = (obj._get_clean_values(), validate_unique)
+    return errors
+
+
 def get_user_profile_model(app_label=None):
     """
     This function should return the user profile class dynamically.
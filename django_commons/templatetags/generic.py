@@ -1,12 +1,87 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import six
+
 from django import template
 from django.conf import settings
 from django.template.defaultfilters import stringfilter
 
 register = template.Library()
 
+# marks a failed lookup, since `None` is a legitimate attribute value
+_MISSING = object()
+
+# compiled accessors, keyed by the type of the object and the type and value
+# of the filter argument. cleared when it grows beyond the given size, to
+# avoid unbounded growth when filter arguments come from variables.
+_accessor_cache = {}
+_ACCESSOR_CACHE_SIZE = 4096
+
+
+def _has_dynamic_attributes(cls):
+    """
+    Return whether instances of the class could have attributes which are
+    not visible on the class itself.
+    """
+    if cls.__getattribute__ is not object.__getattribute__:
+        return True
+    return any('__dict__' in vars(k) or '__getattr__' in vars(k) for k in cls.__mro__)
+
+
+def _compile_hasattrib(cls, arg):
+    name = str(arg)
+    if not _has_dynamic_attributes(cls) and not hasattr(cls, name):
+        return lambda value: False
+    return lambda value: hasattr(value, name)
+
+
+def _compile_getattrib(cls, arg):
+    """
+    Resolve the lookup strategy of `getattrib` filter for instances of the
+    given class, and return a function which applies it to a value.
+
+    The function returns `_MISSING` if the lookup fails.
+    """
+    name = str(arg)
+    try:
+        index = int(arg)
+    except (TypeError, ValueError):
+        index = None
+    dynamic = _has_dynamic_attributes(cls)
+    check_attr = dynamic or hasattr(cls, name)
+    check_key = dynamic or hasattr(cls, 'has_key')
+
+    def getter(value):
+        if check_attr:
+            result = getattr(value, name, _MISSING)
+            if result is not _MISSING:
+                return result
+        if check_key and hasattr(value, 'has_key') and value.has_key(arg):
+            return value[arg]
+        if index is not None and len(value) > index:
+            return value[index]
+        return _MISSING
+
+    return getter
+
+
+def _get_accessor(compiler, value, arg):
+    key = (compiler, type(value), type(arg), arg)
+    try:
+        return _accessor_cache[key]
+    except KeyError:
+        pass
+    except TypeError:
+        # unhashable argument, can not be cached
+        return compiler(type(value), arg)
+
+    accessor = compiler(type(value), arg)
+    if len(_accessor_cache) >= _ACCESSOR_CACHE_SIZE:
+        _accessor_cache.clear()
+    _accessor_cache[key] = accessor
+    return accessor
+
 
 @register.filter
 def hasattrib(value, arg):
@@ -14,7 +89,7 @@ def hasattrib(value, arg):
     returns a boolean indicating whether an object has a particular attribute
     usage: {{ obj|hasattrib:someattr }}
     """
-    return hasattr(value, str(arg))
+    return _get_accessor(_compile_hasattrib, value, arg)(value)
 
 
 @register.filter
@@ -23,17 +98,35 @@ def getattrib(value, arg):
     gets an attribute of an object dynamically from a string name
     usage: {{ obj|getattrib:someattr }}
     """
-    is_int = True
-    try:
-        int(arg)
-    except ValueError:
-        is_int = False
-
-    if hasattr(value, str(arg)):
-        return getattr(value, arg)
-    elif hasattr(value, 'has_key') and value.has_key(arg):
-        return value[arg]
-    elif is_int and len(value) > int(arg):
-        return value[int(arg)]
-    else:
+    result = _get_accessor(_compile_getattrib, value, arg)(value)
+    if result is _MISSING:
         return settings.TEMPLATE_STRING_IF_INVALID
+    return result
+
+
+@register.filter
+def getattribs(values, args):
+    """
+    gets a list of attributes from each of a list of objects, in the same
+    way as `getattrib`, resulting in a list of rows
+    usage: {% for row in objs|getattribs:"attr1,attr2" %}
+    """
+    if isinstance(args, six.string_types):
+        args = args.split(',')
+
+    getters_by_type = {}
+    rows = []
+    for value in values:
+        cls = type(value)
+        try:
+            getters = getters_by_type[cls]
+        except KeyError:
+            getters = getters_by_type[cls] = [
+                _get_accessor(_compile_getattrib, value, arg) for arg in args
+            ]
+        row = [getter(value) for getter in getters]
+        if any(item is _MISSING for item in row):
+            invalid = settings.TEMPLATE_STRING_IF_INVALID
+            row = [invalid if item is _MISSING else item for item in row]
+        rows.append(row)
+    return rows
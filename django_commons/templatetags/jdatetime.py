@@ -2,13 +2,42 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 import datetime
+import re
 
 import jdatetime
 
 from django import template
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 register = template.Library()
 
+# number of days between 1600-01-01, the epoch used by the jalali conversion
+# algorithm in `jdatetime`, and 1970-01-01, the epoch of `numpy.datetime64`
+_EPOCH_OFFSET_DAYS = (datetime.date(1970, 1, 1) - datetime.date(1600, 1, 1)).days
+
+# numeric `jdatetime` strftime directives supported by `jdtformat_array`,
+# mapped to the printf style conversion and the array holding the value
+_ARRAY_DIRECTIVES = {
+    '%Y': ('%d', 'year'),
+    '%y': ('%02d', 'cyear'),
+    '%m': ('%02d', 'month'),
+    '%-m': ('%d', 'month'),
+    '%d': ('%02d', 'day'),
+    '%-d': ('%d', 'day'),
+    '%j': ('%03d', 'yday'),
+    '%H': ('%02d', 'hour'),
+    '%-H': ('%d', 'hour'),
+    '%M': ('%02d', 'minute'),
+    '%-M': ('%d', 'minute'),
+    '%S': ('%02d', 'second'),
+    '%-S': ('%d', 'second'),
+}
+_directive_re = re.compile(r'%-?[a-zA-Z%]')
+
 
 @register.filter
 def jdtformat(value, fmt='%c', locale='fa_IR'):
@@ -28,3 +57,137 @@ def jdtformat(value, fmt='%c', locale='fa_IR'):
         )
 
     return dt.strftime(fmt)
+
+
+def _split_timestamps(values):
+    """
+    Split an array of `datetime64` values or epoch seconds into an array of
+    days since 1970-01-01 and an array of seconds since start of that day,
+    along with a boolean array marking missing values, i.e. `NaT` or `NaN`,
+    which are converted as the epoch.
+    """
+    if np is None:
+        raise ImportError('numpy is required for vectorized jalali conversion')
+
+    values = np.asarray(values)
+    if values.dtype.kind == 'M':
+        missing = np.isnat(values)
+        if missing.any():
+            values = np.where(missing, np.zeros(1, dtype=values.dtype), values)
+        days = values.astype('datetime64[D]')
+        seconds = (values.astype('datetime64[s]') - days).astype(np.int64)
+        return days.astype(np.int64), seconds, missing
+    if values.dtype.kind in 'iuf':
+        missing = ~np.isfinite(values)
+        if missing.any():
+            values = np.where(missing, 0, values)
+        seconds = np.floor(values).astype(np.int64)
+        return seconds // 86400, seconds % 86400, missing
+    raise NotImplementedError(
+        'dtype "{}" not supported for jalali conversion'.format(values.dtype)
+    )
+
+
+def _jalali_from_days(days):
+    """
+    Return arrays of jalali year, month, day and day of year from an array of
+    days since 1970-01-01.
+
+    This is the arithmetic of `jdatetime`'s gregorian to jalali conversion
+    expressed on whole arrays, so the results are identical.
+    """
+    j_day_no = days + (_EPOCH_OFFSET_DAYS - 79)
+
+    j_np = j_day_no // 12053
+    j_day_no = j_day_no % 12053
+    year = 979 + 33 * j_np + 4 * (j_day_no // 1461)
+    j_day_no = j_day_no % 1461
+
+    # the first year of every 4 year cycle is the leap one
+    rest = j_day_no >= 366
+    tail = j_day_no - 1
+    year = np.where(rest, year + tail // 365, year)
+    j_day_no = np.where(rest, tail % 365, j_day_no)
+
+    # the first six months have 31 days and the next five have 30 days
+    first_half = j_day_no < 186
+    second_half = j_day_no - 186
+    month = np.where(first_half, j_day_no // 31 + 1, second_half // 30 + 7)
+    day = np.where(first_half, j_day_no % 31 + 1, second_half % 30 + 1)
+
+    return year, month, day, j_day_no + 1
+
+
+def gregorian_to_jalali_array(values):
+    """
+    Convert an array of gregorian timestamps to jalali calendar dates.
+
+    `values` can be anything `numpy.asarray` turns into an array of
+    `datetime64` (of any unit) or of numbers, which are taken as seconds
+    since the unix epoch. Timestamps are converted as they are, so
+    `datetime64` values are expected to already be in the desired wall
+    clock time and epoch seconds are taken as UTC.
+
+    Returns a tuple of three integer arrays: jalali year, month and day. If
+    there are missing values (`NaT` or `NaN`), they are masked arrays with
+    those values masked.
+    """
+    days, _, missing = _split_timestamps(values)
+    year, month, day, _ = _jalali_from_days(days)
+    if missing.any():
+        return tuple(np.ma.masked_array(a, mask=missing) for a in (year, month, day))
+    return year, month, day
+
+
+def jdtformat_array(values, fmt='%Y/%m/%d'):
+    """
+    Format an array of gregorian timestamps as jalali date strings.
+
+    This is the vectorized counterpart of `jdtformat` filter, meant for
+    exporting large number of values. Accepted values are the same as
+    `gregorian_to_jalali_array`. Only the numeric directives of `jdatetime`
+    are supported, since others depend on the locale: `%Y`, `%y`, `%m`,
+    `%d`, `%j`, `%H`, `%M`, `%S` and their `%-` unpadded variants.
+
+    Returns a list of strings, with an empty string for each missing value
+    (`NaT` or `NaN`).
+    """
+    days, seconds, missing = _split_timestamps(values)
+    year, month, day, yday = _jalali_from_days(days)
+    columns = {
+        'year': year,
+        'cyear': year % 100,
+        'month': month,
+        'day': day,
+        'yday': yday,
+        'hour': seconds // 3600,
+        'minute': seconds % 3600 // 60,
+        'second': seconds % 60,
+    }
+
+    fields = []
+
+    def repl(match):
+        directive = match.group(0)
+        if directive == '%%':
+            return '%%'
+        try:
+            conversion, field = _ARRAY_DIRECTIVES[directive]
+        except KeyError:
+            raise ValueError(
+                'directive "{}" not supported for vectorized jalali formatting'.format(
+                    directive
+                )
+            )
+        fields.append(field)
+        return conversion
+
+    template_str = _directive_re.sub(repl, fmt)
+    if not fields:
+        result = [template_str % ()] * days.size
+    else:
+        rows = zip(*[columns[field].ravel().tolist() for field in fields])
+        result = [template_str % row for row in rows]
+    for index in np.flatnonzero(missing):
+        result[index] = ''
+    return result
@@ -2,10 +2,62 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 from django import template
+from django.utils.encoding import force_str
+from django.utils.http import urlencode
 
 register = template.Library()
 
 
+def _encode(key, value):
+    # values are rendered as text, like `QueryDict.urlencode` does, so that
+    # e.g. `None` does not make `urlencode` fail
+    return urlencode([(key, force_str(value))])
+
+
+def _get_query_fragments(request):
+    """
+    Return the query parameters of the request as a list of
+    `(key, encoded_fragment)` pairs, in the order they appear in the url.
+
+    The list is computed once and cached on the request, so rendering many
+    links on one page does not re-encode the whole query string each time.
+    """
+    query = request.GET
+    state = getattr(request, '_url_replace_state', None)
+    if state is None or state[0] is not query:
+        fragments = [
+            (key, _encode(key, value))
+            for key, values in query.lists()
+            for value in values
+        ]
+        state = (query, fragments)
+        request._url_replace_state = state
+    return state[1]
+
+
+def _replace_fragments(fragments, params, keys):
+    """
+    Return the list of encoded query fragments with values of the given
+    keys replaced by the ones in params.
+
+    Replaced parameters keep their original position and any other value of
+    the same key is dropped. New parameters are appended in order of keys.
+    """
+    result = []
+    replaced = set()
+    for key, fragment in fragments:
+        if key not in params:
+            result.append(fragment)
+        elif key not in replaced:
+            # to avoid multiple value for a key
+            result.append(_encode(key, params[key]))
+            replaced.add(key)
+    for key in keys:
+        if key not in replaced:
+            result.append(_encode(key, params[key]))
+    return result
+
+
 @register.simple_tag(takes_context=True)
 def url_replace(context, **kwargs):
     """
@@ -22,14 +74,42 @@ def url_replace(context, **kwargs):
     This tag requires `django.template.context_processors.request` context
     processor to be enabled.
 
-    Because the query parameters are put into a dict before being re-encoded,
-    their order is lost.
+    Updated parameters keep their position in the query string and new ones
+    are appended to the end.
     """
+    fragments = _get_query_fragments(context['request'])
+    return '&'.join(_replace_fragments(fragments, kwargs, list(kwargs)))
 
-    query = context['request'].GET.copy()
-    for key in kwargs.keys():
-        if key in query:
-            # to avoid multiple value for a key
-            del query[key]
-    query.update(kwargs)
-    return query.urlencode()
+
+@register.simple_tag(takes_context=True)
+def url_replace_range(context, param, values, **kwargs):
+    """
+    Render the query string for each of the given values of a parameter.
+
+    Returns a list of `(value, query_string)` pairs, which is useful for
+    rendering all of pagination links on a page in one call:
+
+        {% url_replace_range 'page' page_obj.paginator.page_range as pages %}
+        {% for page, query in pages %}
+            <a href="?{{ query }}">{{ page }}</a>
+        {% endfor %}
+
+    Other keyword arguments are applied to all of the query strings, the same
+    way as `url_replace` does.
+    """
+    fragments = _get_query_fragments(context['request'])
+    params = dict(kwargs)
+    params[param] = ''
+    keys = [key for key in kwargs if key != param] + [param]
+    parts = _replace_fragments(fragments, params, keys)
+
+    # everything except the given parameter is encoded only once
+    position = parts.index(_encode(param, ''))
+    head = '&'.join(parts[:position])
+    tail = '&'.join(parts[position + 1 :])
+
+    result = []
+    for value in values:
+        middle = _encode(param, value)
+        result.append((value, '&'.join(part for part in (head, middle, tail) if part)))
+    return result
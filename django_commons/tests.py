@@ -1,5 +1,118 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
-from django.test import TestCase
+import datetime
+import unittest
 
-# Create your tests here.
+import jdatetime
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.template import Context, Engine
+from django.test import RequestFactory, SimpleTestCase, TestCase
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from hypothesis import given, settings, strategies as st
+except ImportError:
+    given = None
+
+from .context_processors import current_datetime
+from .managers import get_user_manager
+from .middleware.thread_locals import _current_request
+from .templatetags.jdatetime import (
+    gregorian_to_jalali_array,
+    jdtformat,
+    jdtformat_array,
+)
+
+
+@unittest.skipIf(np is None, 'numpy is not installed')
+class JalaliArrayTests(SimpleTestCase):
+    FORMAT = '%Y-%m-%d %H:%M:%S %j %y %-m/%-d %%'
+
+    if given is not None:
+
+        # jdatetime only supports gregorian dates in this range
+        @settings(max_examples=500, deadline=None)
+        @given(
+            st.datetimes(
+                min_value=datetime.datetime(623, 1, 1),
+                max_value=datetime.datetime(9999, 3, 1),
+            )
+        )
+        def test_matches_jdatetime(self, value):
+            values = np.array([value], dtype='datetime64[us]')
+            year, month, day = gregorian_to_jalali_array(values)
+            expected = jdatetime.date.fromgregorian(date=value.date())
+            self.assertEqual(
+                (year[0], month[0], day[0]),
+                (expected.year, expected.month, expected.day),
+            )
+            self.assertEqual(
+                jdtformat_array(values, self.FORMAT)[0], jdtformat(value, self.FORMAT)
+            )
+
+    def test_epoch_seconds(self):
+        value = datetime.datetime(2020, 3, 20, 12, 30, 15)
+        seconds = (value - datetime.datetime(1970, 1, 1)).total_seconds()
+        self.assertEqual(
+            jdtformat_array([seconds], self.FORMAT), [jdtformat(value, self.FORMAT)]
+        )
+
+    def test_missing_values(self):
+        values = np.array(['2020-03-20', 'NaT'], dtype='datetime64[s]')
+        self.assertEqual(jdtformat_array(values), ['1399/01/01', ''])
+        year, month, day = gregorian_to_jalali_array(values)
+        self.assertEqual(year.mask.tolist(), [False, True])
+        self.assertEqual(jdtformat_array([0.0, float('nan')]), ['1348/10/11', ''])
+
+
+class UserSubsetManagerTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('user')
+        self.user.user_permissions.add(
+            Permission.objects.get(codename='view_user', content_type__app_label='auth')
+        )
+        # a fresh instance, without the permission cache of the one above
+        self.user = get_user_model().objects.get(pk=self.user.pk)
+        self.request = RequestFactory().get('/')
+        self.request.user = self.user
+
+    def test_is_exempt_queries_once_per_request(self):
+        managers = [
+            get_user_manager(user_rel='user', exempt_perm=perm)
+            for perm in ['auth.view_user', 'auth.change_user'] * 200
+        ]
+        token = _current_request.set(self.request)
+        try:
+            # the user and group permissions, once for all managers
+            with self.assertNumQueries(2):
+                results = [manager.is_exempt(self.user) for manager in managers]
+        finally:
+            _current_request.reset(token)
+        self.assertEqual(results, [True, False] * 200)
+
+    def test_is_exempt_without_request(self):
+        manager = get_user_manager(user_rel='user', exempt_perm='auth.view_user')
+        self.assertTrue(manager.is_exempt(self.user))
+        self.assertFalse(get_user_manager(user_rel='user').is_exempt(self.user))
+
+
+class CurrentDatetimeTests(SimpleTestCase):
+    def test_date_arithmetic(self):
+        context = current_datetime(RequestFactory().get('/'))
+        context['earlier'] = context['current_datetime'] - datetime.timedelta(days=3)
+        template = Engine().from_string(
+            '{{ current_datetime|timesince:earlier }}|'
+            '{{ earlier|timeuntil:current_datetime }}|'
+            '{{ earlier|timesince:current_datetime }}|'
+            '{{ earlier|timesince:current_datetime_local }}'
+        )
+        self.assertEqual(
+            template.render(Context(context)),
+            '0\xa0minutes|0\xa0minutes|3\xa0days|3\xa0days',
+        )
@@ -2,21 +2,52 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 import logging
+import threading
+import time
 from functools import wraps
 
 import six
 
 from django.conf import settings
-from django.contrib.auth import REDIRECT_FIELD_NAME
+from django.contrib.auth import REDIRECT_FIELD_NAME, get_user_model
+from django.contrib.auth.models import Group, Permission
 from django.contrib.auth.views import redirect_to_login
+from django.core.cache import caches
 from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.db.models import Exists, Func, IntegerField, OuterRef, Q, Subquery
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_migrate,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import receiver
 from django.shortcuts import resolve_url
 from django.utils.decorators import available_attrs
 from django.utils.six.moves.urllib.parse import urlparse
 
+from ..middleware.thread_locals import get_request_cache
+
 logger = logging.getLogger(__name__)
 
 
+def _resolve_login_url(login_url, cache):
+    """
+    Return the resolved login url with its scheme and net location, cached
+    per unresolved url, since it only depends on the settings and urlconf.
+    """
+    login_url = login_url or settings.LOGIN_URL
+    try:
+        return cache[login_url]
+    except KeyError:
+        resolved_login_url = resolve_url(login_url)
+        login_scheme, login_netloc = urlparse(resolved_login_url)[:2]
+        result = cache[login_url] = (resolved_login_url, login_scheme, login_netloc)
+        return result
+
+
 def req_passes_test(
     test_func, login_url=None, redirect_field_name=REDIRECT_FIELD_NAME, is_403=False
 ):
@@ -27,7 +58,10 @@ def req_passes_test(
 
     Optionally if test fails, return error code 403, instead of redirecting
     to login page.
+
+    The login url is resolved on the first redirect and reused afterwards.
     """
+    resolved_login_urls = {}
 
     def decorator(view_func):
         @wraps(view_func, assigned=available_attrs(view_func))
@@ -36,19 +70,18 @@ def req_passes_test(
                 return view_func(request, *args, **kwargs)
             if is_403:
                 raise PermissionDenied()
-            path = request.build_absolute_uri()
-            resolved_login_url = resolve_url(login_url or settings.LOGIN_URL)
+            resolved_login_url, login_scheme, login_netloc = _resolve_login_url(
+                login_url, resolved_login_urls
+            )
             # If the login url is the same scheme and net location then just
             # use the path as the "next" url.
-            login_scheme, login_netloc = urlparse(resolved_login_url)[:2]
-            current_scheme, current_netloc = urlparse(path)[:2]
-            if (not login_scheme or login_scheme == current_scheme) and (
-                not login_netloc or login_netloc == current_netloc
+            if (not login_scheme or login_scheme == request.scheme) and (
+                not login_netloc or login_netloc == request.get_host()
             ):
                 path = request.get_full_path()
-            logger.debug(
-                'redirecting to "{}", next "{}"'.format(resolved_login_url, path)
-            )
+            else:
+                path = request.build_absolute_uri()
+            logger.debug('redirecting to "%s", next "%s"', resolved_login_url, path)
             return redirect_to_login(path, resolved_login_url, redirect_field_name)
 
         return _wrapped_view
@@ -56,15 +89,83 @@ def req_passes_test(
     return decorator
 
 
+def request_has_perm(request, perm):
+    """
+    Return whether the user of the request has the given permission, and
+    remember the answer for the rest of the request.
+    """
+    cache = get_request_cache(request)
+    key = ('has_perm', request.user.pk, perm)
+    try:
+        return cache[key]
+    except KeyError:
+        result = cache[key] = request.user.has_perm(perm)
+        return result
+
+
+def request_permissions(request):
+    """
+    Return the set of all permission names of the user of the request,
+    loaded once per request.
+    """
+    cache = get_request_cache(request)
+    key = ('all_permissions', request.user.pk)
+    try:
+        return cache[key]
+    except KeyError:
+        perms = cache[key] = frozenset(request.user.get_all_permissions())
+        return perms
+
+
 def req_permission_required(perm, **kwargs):
     """
     Decorator for views that checks whether a user has a particular permission
     enabled.
+
+    The result is remembered for the request, so stacked decorators or other
+    code calling `request_has_perm` do not check it again.
+    """
+    return req_passes_test(lambda req: request_has_perm(req, perm), **kwargs)
+
+
+def req_permissions_required(perms, require_all=True, use_index=False, **kwargs):
     """
-    return req_passes_test(lambda req: req.user.has_perm(perm), **kwargs)
+    Decorator for views that checks whether a user has all, or with
+    `require_all=False` any, of the given permissions.
+
+    The permissions are checked against the set of all permissions of the
+    user, loaded once per request, instead of calling `has_perm` for each.
+    Active superusers pass without loading anything. With `use_index`, the
+    permissions are looked up in `permission_index` instead, which needs no
+    queries once the index is warm.
+
+    Only permissions reported by `get_all_permissions` of the authentication
+    backends are considered, so object level or other custom checks done
+    in `has_perm` of a backend should use `req_permission_required`.
+    """
+    perms = frozenset(perms)
+    check = all if require_all else any
+
+    def test_func(request):
+        user = request.user
+        if not user.is_active:
+            return False
+        if user.is_superuser:
+            return True
+        if use_index:
+            return check(
+                user.pk in permission_index.get_user_ids(perm) for perm in perms
+            )
+        if require_all:
+            return perms <= request_permissions(request)
+        return not perms.isdisjoint(request_permissions(request))
+
+    return req_passes_test(test_func, **kwargs)
 
 
-def users_with_perm(perm_name, include_superusers=False, exclude_superusers=False):
+def users_with_perm(
+    perm_name, include_superusers=False, exclude_superusers=False, use_index=False
+):
     """
     Return a queryset with all users who have a particular permission.
 
@@ -73,6 +174,9 @@ def users_with_perm(perm_name, include_superusers=False, exclude_superusers=Fals
 
     `exclude_superusers` parameter could be useful to isolate permission
     problems.
+
+    With `use_index`, the users are looked up by id from `permission_index`
+    instead of joining the permission tables.
     """
     assert isinstance(perm_name, six.string_types)
     assert not (
@@ -96,6 +200,8 @@ def users_with_perm(perm_name, include_superusers=False, exclude_superusers=Fals
             Q(groups__permissions__codename=code_name)
             & Q(groups__permissions__content_type__app_label=app_label)
         )
+    if use_index:
+        lookup = Q(pk__in=permission_index.get_user_ids(perm_name))
 
     if include_superusers:
         lookup = Q(is_superuser=True) | lookup
@@ -108,34 +214,339 @@ def users_with_perm(perm_name, include_superusers=False, exclude_superusers=Fals
     return q
 
 
+def get_permission_ids(perms):
+    """
+    Return a list with the set of ids of permissions matching each of the
+    given permission names, in the same order, using a single query.
+
+    Names are either ``app_label.codename`` or a bare codename, which may
+    match permissions in more than one app.
+    """
+    names = []
+    lookup = Q()
+    for perm_name in perms:
+        if '.' in perm_name:
+            app_label, code_name = perm_name.split('.', 1)
+        else:
+            app_label, code_name = None, perm_name
+        names.append((app_label, code_name))
+        if app_label:
+            lookup |= Q(codename=code_name, content_type__app_label=app_label)
+        else:
+            lookup |= Q(codename=code_name)
+
+    if not names:
+        return []
+    rows = Permission.objects.filter(lookup).values_list(
+        'pk', 'codename', 'content_type__app_label'
+    )
+    ids = [set() for _ in names]
+    for pk, code_name, app_label in rows:
+        for index, name in enumerate(names):
+            if name[1] == code_name and name[0] in (None, app_label):
+                ids[index].add(pk)
+    return ids
+
+
+class _CountDistinct(Func):
+    """
+    `COUNT(DISTINCT ...)` which is not an aggregate to the ORM, so it can
+    count the rows of a correlated subquery without grouping them.
+    """
+
+    template = 'COUNT(DISTINCT %(expressions)s)'
+    output_field = IntegerField()
+
+
 def users_with_perms(
     perms, include_superusers=False, exclude_superusers=False, combine='intersection'
 ):
     """
-    Return a queryset with union or intersection of all users with given permissions.
-
-    Takes a list of permissions and returns either union or intersection of
-    individual querysets that return users with a single permission.
+    Return a queryset of users who have all (`intersection`) or any (`union`)
+    of the given permissions, directly or through any of their groups.
 
-    Make sure that the list of permissions is reasonably small, otherwise
-    this can result in a very big query body being sent ot the db.
+    Permission names are resolved to ids once, and the users are selected in
+    a single query with one correlated subquery which counts the distinct
+    permissions held, so the query stays flat as the list grows. Unlike
+    before, the result is a plain queryset which can be filtered further.
     """
     assert isinstance(perms, (list, tuple))
     assert combine in [
         'union',
         'intersection',
     ], 'either union or intersection must be set'
+    assert not (
+        include_superusers and exclude_superusers
+    ), 'both actively including and excluding superusers is contradictory'
 
+    user_model = get_user_model()
+    if not perms:
+        if combine == 'union':
+            return user_model.objects.none()
+        return user_model.objects.all()
+
+    perm_ids = set(frozenset(ids) for ids in get_permission_ids(perms))
+    if combine == 'intersection' and frozenset() in perm_ids:
+        # some permission does not exist, so nobody can have it
+        perm_ids = set([frozenset()])
+    perm_ids.discard(frozenset())
+
+    def held(ids):
+        # permissions in ids held by the outer user, directly or through groups
+        return Permission.objects.filter(pk__in=ids).filter(
+            Q(user=OuterRef('pk')) | Q(group__user=OuterRef('pk'))
+        ).order_by()
+
+    annotations = {}
     if combine == 'union':
-        q = get_user_model().objects.none()
+        all_ids = set().union(*perm_ids)
+        annotations['_perms_held'] = Exists(held(all_ids))
+        lookup = Q(_perms_held=True)
     else:
-        q = get_user_model().objects.all()
-
-    for perm in perms:
-        if combine == 'union':
-            q = q.union(users_with_perm(perm, include_superusers, exclude_superusers))
-        else:
-            q = q.intersection(
-                users_with_perm(perm, include_superusers, exclude_superusers)
+        # names matching a single permission are checked all at once by
+        # counting them, and bare codenames matching several permissions,
+        # which are rare, by one subquery each
+        single_ids = set(ids for ids in perm_ids if len(ids) == 1)
+        lookup = Q()
+        if single_ids:
+            all_ids = set().union(*single_ids)
+            annotations['_perms_held'] = Subquery(
+                held(all_ids).annotate(count=_CountDistinct('pk')).values('count'),
+                output_field=IntegerField(),
             )
+            lookup &= Q(_perms_held=len(all_ids))
+        for index, ids in enumerate(perm_ids - single_ids):
+            alias = '_perms_held_{}'.format(index)
+            annotations[alias] = Exists(held(ids))
+            lookup &= Q(**{alias: True})
+    if not perm_ids:
+        lookup = Q(pk__in=[])
+
+    if include_superusers:
+        lookup = Q(is_superuser=True) | lookup
+    elif exclude_superusers:
+        lookup = Q(is_superuser=False) & lookup
+
+    q = user_model.objects.annotate(**annotations).filter(lookup)
     return q
+
+
+class PermissionIndex(object):
+    """
+    Cached index from permissions to the ids of users who have them, either
+    directly or through any of their groups, to answer repeated lookups
+    without joining the permission tables. Superusers are not included,
+    unless they have the permission explicitly.
+
+    The index is kept in the cache named by `PERMISSION_INDEX_CACHE` setting
+    for `PERMISSION_INDEX_TIMEOUT` seconds, or in the memory of the process
+    if it is not set, which is only correct if permissions are changed by
+    this process alone. Cache keys contain a version stamp, which is bumped
+    to drop the whole index at once.
+
+    Entries are invalidated precisely by the signal receivers in this
+    module, when permissions of users or groups or memberships of groups
+    change, or users or groups are deleted. The whole index is dropped when
+    permissions are created or deleted. These receivers are connected when
+    this module is imported, so it must be imported in every process which
+    changes permissions, e.g. in `AppConfig.ready`. Changes which do not send
+    signals, like queryset `delete` or raw SQL, should be followed by a call
+    to `invalidate`.
+    """
+
+    def __init__(self):
+        self._local = {}
+        self._lock = threading.Lock()
+
+    def _get_cache(self):
+        alias = getattr(settings, 'PERMISSION_INDEX_CACHE', None)
+        return caches[alias] if alias else None
+
+    def _get_prefix(self, cache):
+        key_prefix = getattr(settings, 'PERMISSION_INDEX_KEY_PREFIX', 'perm_index')
+        version_key = key_prefix + '.version'
+        version = cache.get(version_key)
+        if version is None:
+            cache.add(version_key, int(time.time() * 1000), None)
+            version = cache.get(version_key)
+        return '{}.{}.'.format(key_prefix, version)
+
+    def _get_many(self, keys):
+        cache = self._get_cache()
+        if cache is None:
+            local = self._local
+            return dict((key, local[key]) for key in keys if key in local)
+        prefix = self._get_prefix(cache)
+        values = cache.get_many([prefix + key for key in keys])
+        return dict((key[len(prefix) :], value) for key, value in values.items())
+
+    def _set_many(self, values):
+        cache = self._get_cache()
+        if cache is None:
+            with self._lock:
+                self._local.update(values)
+            return
+        prefix = self._get_prefix(cache)
+        cache.set_many(
+            dict((prefix + key, value) for key, value in values.items()),
+            getattr(settings, 'PERMISSION_INDEX_TIMEOUT', 3600),
+        )
+
+    def get_user_ids(self, perm_name):
+        """
+        Return a frozenset of ids of users who have the given permission,
+        named as ``app_label.codename`` or by its codename alone.
+        """
+        name_key = 'name.' + perm_name
+        perm_ids = self._get_many([name_key]).get(name_key)
+        if perm_ids is None:
+            perm_ids = frozenset(get_permission_ids([perm_name])[0])
+            self._set_many({name_key: perm_ids})
+
+        keys = ['perm.{}'.format(pk) for pk in perm_ids]
+        entries = self._get_many(keys)
+        missing = [pk for pk, key in zip(perm_ids, keys) if key not in entries]
+        if missing:
+            entries.update(self._load(missing))
+        return frozenset().union(*entries.values())
+
+    def _load(self, perm_ids):
+        user_ids = dict((pk, set()) for pk in perm_ids)
+        user_model = get_user_model()
+        for lookup in ('user_permissions', 'groups__permissions'):
+            rows = user_model.objects.filter(
+                **{lookup + '__in': perm_ids}
+            ).values_list(lookup, 'pk')
+            for perm_id, user_id in rows:
+                user_ids[perm_id].add(user_id)
+        entries = dict(
+            ('perm.{}'.format(pk), frozenset(ids)) for pk, ids in user_ids.items()
+        )
+        self._set_many(entries)
+        return entries
+
+    def invalidate(self, perm_ids=None):
+        """
+        Drop the entries of the given permission ids, or the whole index.
+
+        Entries are dropped again when the current transaction is committed,
+        since they may have been reloaded from data visible before that.
+        """
+        perm_ids = None if perm_ids is None else list(perm_ids)
+        if perm_ids == []:
+            return
+        self._invalidate(perm_ids)
+        transaction.on_commit(lambda: self._invalidate(perm_ids))
+
+    def _invalidate(self, perm_ids):
+        cache = self._get_cache()
+        if perm_ids is None:
+            logger.debug('dropping the permission index')
+            if cache is None:
+                with self._lock:
+                    self._local.clear()
+            else:
+                key_prefix = getattr(
+                    settings, 'PERMISSION_INDEX_KEY_PREFIX', 'perm_index'
+                )
+                try:
+                    cache.incr(key_prefix + '.version')
+                except ValueError:
+                    pass
+            return
+
+        keys = ['perm.{}'.format(pk) for pk in perm_ids]
+        if cache is None:
+            with self._lock:
+                for key in keys:
+                    self._local.pop(key, None)
+        else:
+            prefix = self._get_prefix(cache)
+            cache.delete_many([prefix + key for key in keys])
+
+
+permission_index = PermissionIndex()
+
+
+def _group_permission_ids(group_ids):
+    return Permission.objects.filter(group__in=group_ids).values_list('pk', flat=True)
+
+
+def _user_permission_ids(user):
+    return list(user.user_permissions.values_list('pk', flat=True)) + list(
+        _group_permission_ids(user.groups.values('pk'))
+    )
+
+
+def _changed_permission_ids(sender, instance, reverse, pk_set):
+    """
+    Return ids of permissions whose holders change by an `m2m_changed`
+    signal. For clear actions `pk_set` is None, so all related objects are
+    affected.
+    """
+    user_model = get_user_model()
+    if sender is user_model.user_permissions.through:
+        if reverse:
+            return [instance.pk]
+        if pk_set is None:
+            return instance.user_permissions.values_list('pk', flat=True)
+        return pk_set
+    if sender is user_model.groups.through:
+        if reverse:
+            return _group_permission_ids([instance.pk])
+        if pk_set is None:
+            return _group_permission_ids(instance.groups.values('pk'))
+        return _group_permission_ids(pk_set)
+    if sender is Group.permissions.through:
+        if reverse:
+            return [instance.pk]
+        if pk_set is None:
+            return instance.permissions.values_list('pk', flat=True)
+        return pk_set
+    return None
+
+
+@receiver(m2m_changed, dispatch_uid='django_commons_permission_index_m2m')
+def _invalidate_permission_index(
+    sender, instance, action, reverse, pk_set=None, **kwargs
+):
+    if action == 'pre_clear':
+        # find what is going to be cleared while it still exists
+        perm_ids = _changed_permission_ids(sender, instance, reverse, None)
+        if perm_ids is not None:
+            instance._permission_index_cleared = list(perm_ids)
+    elif action == 'post_clear':
+        permission_index.invalidate(
+            instance.__dict__.pop('_permission_index_cleared', None) or []
+        )
+    elif action in ('post_add', 'post_remove'):
+        perm_ids = _changed_permission_ids(sender, instance, reverse, pk_set)
+        if perm_ids is not None:
+            permission_index.invalidate(perm_ids)
+
+
+@receiver(pre_delete, dispatch_uid='django_commons_permission_index_pre_delete')
+def _find_deleted_permission_holders(sender, instance, **kwargs):
+    if sender is get_user_model():
+        instance._permission_index_deleted = _user_permission_ids(instance)
+    elif sender is Group:
+        instance._permission_index_deleted = list(
+            _group_permission_ids([instance.pk])
+        )
+
+
+@receiver(post_delete, dispatch_uid='django_commons_permission_index_post_delete')
+def _invalidate_deleted_permission_holders(sender, instance, **kwargs):
+    if sender is Permission:
+        permission_index.invalidate()
+    else:
+        perm_ids = instance.__dict__.pop('_permission_index_deleted', None)
+        if perm_ids:
+            permission_index.invalidate(perm_ids)
+
+
+@receiver(post_save, sender=Permission, dispatch_uid='django_commons_permission_index')
+@receiver(post_migrate, dispatch_uid='django_commons_permission_index_migrate')
+def _invalidate_permission_names(sender, **kwargs):
+    # names may now resolve to different permissions
+    permission_index.invalidate()
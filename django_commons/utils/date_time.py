@@ -4,12 +4,110 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 import datetime
 import logging
 
+import django
 import pytz
 
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 from django.utils import timezone
 
+try:
+    import zoneinfo
+except ImportError:
+    zoneinfo = None
+
 logger = logging.getLogger(__name__)
 
+# process-wide cache of canonical timezone names to tzinfo objects, which
+# is bounded by the number of known timezones
+_timezone_cache = {}
+
+# lowercased names of known timezones to their canonical names
+_timezone_names = None
+
+
+def _use_pytz():
+    return zoneinfo is None or getattr(
+        settings, 'USE_DEPRECATED_PYTZ', django.VERSION < (4, 0)
+    )
+
+
+def _load_timezone(name):
+    if _use_pytz():
+        return pytz.timezone(name)
+    return zoneinfo.ZoneInfo(name)
+
+
+@receiver(setting_changed)
+def _reset_timezone_cache(setting=None, **kwargs):
+    global _timezone_names
+    if setting == 'USE_DEPRECATED_PYTZ':
+        _timezone_names = None
+        _timezone_cache.clear()
+
+
+def get_canonical_timezone_name(name):
+    """
+    Return the canonical name of a known timezone, matched case
+    insensitively like `pytz` does, or None if the name is not known.
+    """
+    global _timezone_names
+    names = _timezone_names
+    if names is None:
+        if _use_pytz():
+            available = pytz.all_timezones_set
+        else:
+            available = zoneinfo.available_timezones()
+        names = _timezone_names = dict((tz.lower(), tz) for tz in available)
+    return names.get(name.lower())
+
+
+def get_timezone(name):
+    """
+    Return the tzinfo object for the given timezone name.
+
+    Like Django itself, `zoneinfo` is used when available, unless
+    `USE_DEPRECATED_PYTZ` is set or Django is older than 4.0, in which case
+    `pytz` is used.
+
+    Names are validated against the known timezones before anything is
+    loaded, so they may come from clients. Results are cached for the
+    lifetime of the process by canonical name. Unknown names raise the
+    exception of the underlying library.
+    """
+    canonical_name = get_canonical_timezone_name(name)
+    if canonical_name is None:
+        if _use_pytz():
+            raise pytz.UnknownTimeZoneError(name)
+        raise zoneinfo.ZoneInfoNotFoundError(
+            'No time zone found with key {}'.format(name)
+        )
+    try:
+        return _timezone_cache[canonical_name]
+    except KeyError:
+        pass
+    tz = _timezone_cache[canonical_name] = _load_timezone(canonical_name)
+    return tz
+
+
+def request_now(request=None):
+    """
+    Return the current time as an aware datetime object, frozen for the
+    lifetime of the given request.
+
+    Every caller during one request gets the same instant, so all templates
+    and fragments rendered for it show a consistent time. Without a request,
+    this is the same as `timezone.now()`.
+    """
+    if request is None:
+        return timezone.now()
+    try:
+        return request._request_now
+    except AttributeError:
+        now = request._request_now = timezone.now()
+        return now
+
 
 def in_active_timezone(value, noexp=False):
     """
@@ -1,22 +1,153 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import bisect
+import ipaddress
 import logging
+import socket
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_TRUSTED_PROXIES = ('127.0.0.0/8', '::1/128')
 
-def get_client_ip(request):
+
+def _strip_port(value):
+    """
+    Return the address in a forwarding header entry, without the port or
+    the brackets around IPv6 addresses.
     """
-    Try various attributes of the request in order to get the real IP address
-    of client.
+    value = value.strip()
+    if value.startswith('['):
+        return value[1 : value.find(']')]
+    if value.count(':') == 1:
+        return value.split(':', 1)[0]
+    return value
+
+
+def _parse_ip(value):
     """
+    Return the IP version and integer value of an address, or None if it is
+    not a valid address.
+    """
+    try:
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, value), 'big')
+    except (OSError, ValueError):
+        pass
+    try:
+        packed = socket.inet_pton(socket.AF_INET6, value.split('%', 1)[0])
+    except (OSError, ValueError):
+        return None
+    if packed[:12] == b'\0' * 10 + b'\xff\xff':
+        # IPv4 mapped address
+        return 4, int.from_bytes(packed[12:], 'big')
+    return 6, int.from_bytes(packed, 'big')
+
+
+class TrustedProxies(object):
+    """
+    A set of networks of trusted proxies, parsed once into sorted, merged
+    ranges of integers per IP version, so membership is a binary search.
+    """
+
+    def __init__(self, networks):
+        ranges = {4: [], 6: []}
+        for network in networks:
+            network = ipaddress.ip_network(network, strict=False)
+            ranges[network.version].append(network)
+        self._starts = {}
+        self._ends = {}
+        for version, version_networks in ranges.items():
+            collapsed = list(ipaddress.collapse_addresses(version_networks))
+            self._starts[version] = [int(n.network_address) for n in collapsed]
+            self._ends[version] = [int(n.broadcast_address) for n in collapsed]
+
+    def __contains__(self, address):
+        """
+        Whether the `(version, int)` address, as returned by `_parse_ip`,
+        is in one of the networks.
+        """
+        version, value = address
+        starts = self._starts[version]
+        index = bisect.bisect_right(starts, value) - 1
+        return index >= 0 and value <= self._ends[version][index]
+
+    def resolve(self, remote_addr, forwarded_for=None, real_ip=None):
+        """
+        Return the address of the client, given the address of the peer and
+        the values of `X-Forwarded-For` and `X-Real-IP` headers.
+
+        Headers are only believed when they were set by a trusted proxy.
+        `X-Forwarded-For` is walked from the right, i.e. from the proxy
+        nearest to us, and the first address which is not a trusted proxy is
+        the client. If every hop is trusted, the leftmost one is the client.
+        `X-Real-IP` is used only if there is no `X-Forwarded-For`.
+        """
+        address = _parse_ip(_strip_port(remote_addr)) if remote_addr else None
+        if address is None or address not in self:
+            return remote_addr
 
-    ipaddr = request.META.get('HTTP_X_REAL_IP')
-    if ipaddr is None:
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ipaddr = x_forwarded_for.split(',')[0]
-        else:
-            ipaddr = request.META.get('REMOTE_ADDR')
+        client = remote_addr
+        if forwarded_for:
+            for hop in reversed(forwarded_for.split(',')):
+                host = _strip_port(hop)
+                address = _parse_ip(host)
+                if address is None:
+                    # a trusted proxy would not add this, so the hop after
+                    # it is the nearest address we can believe
+                    logger.debug('invalid address "%s" in X-Forwarded-For', hop)
+                    break
+                client = host
+                if address not in self:
+                    break
+        elif real_ip and _parse_ip(_strip_port(real_ip)) is not None:
+            client = _strip_port(real_ip)
+        return client
+
+
+_trusted_proxies = None
+
+
+@receiver(setting_changed)
+def _reset_trusted_proxies(setting=None, **kwargs):
+    global _trusted_proxies
+    if setting == 'TRUSTED_PROXIES':
+        _trusted_proxies = None
+
+
+def get_trusted_proxies():
+    """
+    Return the `TrustedProxies` built from `TRUSTED_PROXIES` setting, a list
+    of addresses or networks in CIDR notation, by default the loopback.
+    """
+    global _trusted_proxies
+    if _trusted_proxies is None:
+        _trusted_proxies = TrustedProxies(
+            getattr(settings, 'TRUSTED_PROXIES', DEFAULT_TRUSTED_PROXIES)
+        )
+    return _trusted_proxies
+
+
+def get_client_ip(request):
+    """
+    Return the IP address of the client, as seen by the trusted proxies in
+    front of us, configured in `TRUSTED_PROXIES` setting. Forwarding headers
+    added by the client itself or by untrusted proxies are ignored.
+
+    The result is remembered on the request, since it is asked for by
+    logging and rate limiting many times per request.
+    """
+    try:
+        return request._client_ip
+    except AttributeError:
+        pass
+    meta = request.META
+    ipaddr = request._client_ip = get_trusted_proxies().resolve(
+        meta.get('REMOTE_ADDR'),
+        meta.get('HTTP_X_FORWARDED_FOR'),
+        meta.get('HTTP_X_REAL_IP'),
+    )
     return ipaddr
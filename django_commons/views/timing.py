@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import logging
+
+from django.http import JsonResponse
+
+from ..middleware.timing import get_timing_stats, reset_timing_stats
+from ..utils.auth import req_passes_test
+
+logger = logging.getLogger(__name__)
+
+
+@req_passes_test(lambda req: req.user.is_staff, is_403=True)
+def timing_stats(request):
+    """
+    Return the per-view timing percentiles recorded by
+    `RequestTimingMiddleware` in this process, as a JSON document.
+
+    Since each worker process keeps its own statistics, successive requests
+    may be answered by different processes. Pass `reset=1` in a POST
+    request to start over.
+    """
+    stats = get_timing_stats()
+    if request.method == 'POST' and request.POST.get('reset'):
+        reset_timing_stats()
+    return JsonResponse(stats)
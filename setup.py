@@ -35,12 +35,8 @@ classifiers = [
     'Operating System :: POSIX',
     'Operating System :: POSIX :: Linux',
     'Operating System :: MacOS',
-    'Programming Language :: Python :: 2',
-    'Programming Language :: Python :: 2.7',
     'Programming Language :: Python :: 3',
-    'Programming Language :: Python :: 3.4',
-    'Programming Language :: Python :: 3.5',
-    'Programming Language :: Python :: 3.6',
+    'Programming Language :: Python :: 3 :: Only',
     'Programming Language :: Python :: 3.7',
     'Programming Language :: Python :: 3.8',
     'Programming Language :: Python :: 3.9',
@@ -75,7 +71,7 @@ setup(
     url='https://gitlab.com/zaade/django-commons',
     license='GPLv3+',
     platforms='any',
-    python_requires='>=2.7',
+    python_requires='>=3.7',
     packages=find_packages(),
     #  package_dir = {'': 'src'},
     include_package_data=True,
@@ -84,6 +80,6 @@ setup(
     tests_require=['nose', 'nose-cover3', 'pytest'],
     test_suite='nose.collector',
     cmdclass={'test': PyTest},
-    extras_require={'testing': ['pytest'],},
+    extras_require={'testing': ['pytest'], 'numpy': ['numpy'],},
     zip_safe=False,
 )